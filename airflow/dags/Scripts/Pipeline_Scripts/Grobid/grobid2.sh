@@ -1,15 +1,11 @@
 #!/bin/bash
 set -e
 
-echo "Waiting for Grobid to start..."
-sleep 30 # Adjust this based on your system's performance
-echo "Grobid has been started and is now ready to process files."
-
-# Note: The Python script should be triggered after this message.
-# Example:
+# Readiness is probed against Grobid's isalive endpoint by grobid_process.py
+# (GROBID_READY_TIMEOUT), so processing starts as soon as the service is up.
 pip install -r requirements.txt
 python grobid_process.py
 # Stop the Grobid container
 # docker stop grobid
 
-echo "Processing completed."
\ No newline at end of file
+echo "Processing completed."
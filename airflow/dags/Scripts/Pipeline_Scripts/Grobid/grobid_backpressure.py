@@ -0,0 +1,56 @@
+import time
+import threading
+import requests
+
+
+def wait_for_grobid(grobid_url, timeout=300, interval=1.0):
+    """Poll Grobid's isalive endpoint until it answers true. Returns the seconds waited.
+
+    Raises TimeoutError if the service is not up within `timeout` seconds.
+    """
+    start = time.perf_counter()
+    while True:
+        try:
+            response = requests.get(f"{grobid_url}/api/isalive", timeout=5)
+            if response.status_code == 200 and response.text.strip().lower() == 'true':
+                return time.perf_counter() - start
+        except requests.RequestException:
+            pass
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"Grobid at {grobid_url} was not ready after {timeout}s")
+        time.sleep(interval)
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the number of in-flight Grobid requests.
+
+    The limit halves when Grobid answers 503 or times out, and grows by roughly one
+    slot per `limit` requests that complete under `target_latency` seconds.
+    """
+
+    def __init__(self, initial_limit, max_limit, min_limit=1, target_latency=30.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.overloads = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        """Free a slot. `latency` is None when the request failed before Grobid answered
+        for a reason unrelated to its load: the limit is then left as it is."""
+        with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.overloads += 1
+                self.limit = max(self.min_limit, self.limit / 2)
+            elif latency is not None and latency <= self.target_latency:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+
+def extract_tei_md5(xml_content):
+    """Return the PDF MD5 Grobid records in <idno type="MD5">, or None if absent."""
+    match = re.search(rb'<idno type="MD5">([0-9A-Fa-f]{32})</idno>', xml_content)
+    return match.group(1).decode().lower() if match else None
+
+
+class GrobidCache:
+    """Persistent cache of Grobid XML/TXT outputs keyed by PDF content hash + Grobid version/config.
+
+    Entries live in `cache_dir` as <key>.xml / <key>.txt with an index.json holding
+    their size and timestamps. Entries older than `max_age_days` are dropped and the
+    least recently used ones are evicted once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024, max_age_days=30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    @staticmethod
+    def make_key(content_hash, grobid_version, options):
+        """Build a cache key from the PDF hash and everything that changes Grobid's output."""
+        payload = json.dumps({
+            'content_hash': content_hash.strip('"').lower(),
+            'grobid_version': grobid_version,
+            'options': options,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, f'{key}.xml'), os.path.join(self.cache_dir, f'{key}.txt')
+
+    def get(self, key):
+        """Return (xml_bytes, txt_text) for a cached document, or None on a miss."""
+        with self._lock:
+            entry = self.index.get(key)
+            xml_path, txt_path = self._paths(key)
+            if entry is None or not os.path.exists(xml_path) or not os.path.exists(txt_path):
+                self.misses += 1
+                return None
+            entry['last_used'] = time.time()
+            self.hits += 1
+        with open(xml_path, 'rb') as f:
+            xml_content = f.read()
+        with open(txt_path, encoding='utf-8') as f:
+            txt_content = f.read()
+        return xml_content, txt_content
+
+    def put(self, key, source, xml_content, txt_content):
+        """Store the Grobid outputs for one document."""
+        xml_path, txt_path = self._paths(key)
+        with open(xml_path, 'wb') as f:
+            f.write(xml_content)
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            f.write(txt_content)
+        now = time.time()
+        with self._lock:
+            self.index[key] = {
+                'source': source,
+                'md5': extract_tei_md5(xml_content),
+                'bytes': os.path.getsize(xml_path) + os.path.getsize(txt_path),
+                'created': now,
+                'last_used': now,
+            }
+
+    def _remove(self, key):
+        self.index.pop(key, None)
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+        self.evictions += 1
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        with self._lock:
+            now = time.time()
+            for key, entry in list(self.index.items()):
+                if now - entry['created'] > self.max_age_seconds:
+                    self._remove(key)
+
+            total_bytes = sum(entry['bytes'] for entry in self.index.values())
+            for key, entry in sorted(self.index.items(), key=lambda item: item[1]['last_used']):
+                if total_bytes <= self.max_bytes:
+                    break
+                total_bytes -= entry['bytes']
+                self._remove(key)
+
+    def save(self):
+        """Apply the eviction policy and persist the index."""
+        self.evict()
+        with self._lock:
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_path, self.index_path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self.index),
+            'bytes': sum(entry['bytes'] for entry in self.index.values()),
+        }
@@ -1,9 +1,23 @@
 import os
+import sys
+import time
+import hashlib
 import boto3
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from io import BytesIO
-from xml.etree import ElementTree
+from pathlib import Path
+from grobid_cache import GrobidCache, extract_tei_md5
+from s3_manifest import IngestionManifest
+from grobid_backpressure import AdaptiveConcurrencyLimiter, wait_for_grobid
+from grobid_sharding import count_pdf_pages, split_pdf, merge_tei_shards
+from grobid_streaming import MultipartPdfStream, create_grobid_session
+from pdf_triage import triage_pdf, build_tei_from_pdf
+
+# Add the Pipeline_Scripts directory to sys.path for the shared TEI extractor
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from tei_extractor import TEIExtractor
 
 # Load environment variables
 load_dotenv()
@@ -15,6 +29,36 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 # S3 Bucket name
 S3_BUCKET_NAME = "bigdatas3team4"
 
+# Grobid service (override GROBID_URL to point at another instance or a local stub server)
+GROBID_URL = os.getenv("GROBID_URL", "http://host.docker.internal:8070")
+
+# Maximum number of PDFs in flight at once (download + Grobid call + disk write per worker).
+# The number of concurrent Grobid calls adapts below this, backing off when Grobid is overloaded.
+GROBID_CONCURRENCY = int(os.getenv("GROBID_CONCURRENCY", "4"))
+GROBID_TARGET_LATENCY = float(os.getenv("GROBID_TARGET_LATENCY", "30"))
+GROBID_TIMEOUT = float(os.getenv("GROBID_TIMEOUT", "300"))
+GROBID_MAX_RETRIES = int(os.getenv("GROBID_MAX_RETRIES", "3"))
+GROBID_BACKOFF_SECONDS = float(os.getenv("GROBID_BACKOFF_SECONDS", "2"))
+GROBID_READY_TIMEOUT = float(os.getenv("GROBID_READY_TIMEOUT", "300"))
+
+# PDFs with more pages than this are split into page-range shards processed in parallel (0 disables sharding)
+GROBID_SHARD_PAGES = int(os.getenv("GROBID_SHARD_PAGES", "0"))
+
+# Inspect each PDF first and build the TEI from its text layer with PyPDF2 when it is simple enough,
+# so only structurally complex documents use Grobid capacity
+PDF_TRIAGE = os.getenv("PDF_TRIAGE", "0") == "1"
+
+# Form fields sent with every processFulltextDocument call (part of the cache key)
+GROBID_OPTIONS = {}
+
+# Cache of Grobid outputs so unchanged PDFs skip the Grobid call on the next run
+GROBID_CACHE_DIR = os.getenv("GROBID_CACHE_DIR", "cache")
+GROBID_CACHE_MAX_MB = int(os.getenv("GROBID_CACHE_MAX_MB", "1024"))
+GROBID_CACHE_MAX_AGE_DAYS = int(os.getenv("GROBID_CACHE_MAX_AGE_DAYS", "30"))
+
+# Watermark of already processed S3 objects, so each run only schedules new/changed PDFs
+GROBID_MANIFEST_PATH = os.getenv("GROBID_MANIFEST_PATH", "manifest.json")
+
 # Initialize a boto3 client
 s3_client = boto3.client(
     's3',
@@ -22,58 +66,264 @@ s3_client = boto3.client(
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
 )
 
+# Keep-alive connections to Grobid shared by all workers (shard calls included)
+grobid_session = create_grobid_session(GROBID_CONCURRENCY * 2)
+
+def list_s3_pdf_objects(bucket_name, prefix=''):
+    """Page through the full bucket listing and yield the summaries (Key, ETag, LastModified) of PDF objects."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].lower().endswith('.pdf'):
+                yield obj
+
 def list_s3_objects(bucket_name):
     """List PDF objects in an S3 bucket."""
-    response = s3_client.list_objects_v2(Bucket=bucket_name)
-    return [obj["Key"] for obj in response.get("Contents", []) if obj["Key"].lower().endswith('.pdf')]
+    return [obj["Key"] for obj in list_s3_pdf_objects(bucket_name)]
+
+def get_grobid_version():
+    """Return the version reported by the Grobid service, or 'unknown' if it can't be reached."""
+    try:
+        response = grobid_session.get(f"{GROBID_URL}/api/version", timeout=10)
+        if response.status_code == 200:
+            return response.text.strip()
+    except requests.RequestException as e:
+        print(f"Could not fetch Grobid version: {e}")
+    return "unknown"
+
+def open_s3_pdf(bucket_name, pdf_file):
+    """Open a PDF in S3 for streaming. Returns (file-like body, content length)."""
+    response = s3_client.get_object(Bucket=bucket_name, Key=pdf_file)
+    return response['Body'], response['ContentLength']
+
+def open_pdf_bytes(pdf_content):
+    return BytesIO(pdf_content), len(pdf_content)
+
+def post_to_grobid(pdf_file, open_body, limiter=None):
+    """POST a PDF to processFulltextDocument, backing off and retrying while Grobid is overloaded.
+
+    `open_body` returns a fresh (file-like, length) pair for the PDF on every attempt,
+    since a streamed upload can only be read once.
+    """
+    for attempt in range(GROBID_MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire()
+        start = time.perf_counter()
+        response = None
+        # Only a 503, a timeout or a refused connection count as Grobid being overloaded;
+        # any other failure (e.g. reading the PDF from S3) is raised without touching the limit
+        overloaded = False
+        latency = None
+        body = None
+        try:
+            body, content_length = open_body()
+            stream = MultipartPdfStream('input', pdf_file, body, content_length, fields=GROBID_OPTIONS)
+            response = grobid_session.post(f"{GROBID_URL}/api/processFulltextDocument", data=stream,
+                                           headers={'Content-Type': stream.content_type}, timeout=GROBID_TIMEOUT)
+            latency = time.perf_counter() - start
+            # Grobid answers 503 when all of its workers are busy
+            overloaded = response.status_code == 503
+        except (requests.Timeout, requests.ConnectionError) as e:
+            print(f"Grobid request for {pdf_file} failed: {e}")
+            overloaded = True
+        finally:
+            if body is not None:
+                body.close()
+            if limiter is not None:
+                limiter.release(latency, overloaded)
+        if not overloaded:
+            return response
+        if attempt < GROBID_MAX_RETRIES:
+            delay = GROBID_BACKOFF_SECONDS * 2 ** attempt
+            print(f"Grobid overloaded while processing {pdf_file}, retrying in {delay:.0f}s "
+                  f"(attempt {attempt + 1}/{GROBID_MAX_RETRIES})")
+            time.sleep(delay)
+    if response is None:
+        raise TimeoutError(f"Grobid did not answer for {pdf_file} after {GROBID_MAX_RETRIES + 1} attempts")
+    return response
+
+def run_grobid(bucket_name, pdf_file, limiter=None):
+    """Return (status_code, TEI bytes, route) for a PDF in S3.
+
+    With PDF_TRIAGE, simple PDFs are routed to the PyPDF2 fast path ('pypdf') and only
+    the others go to Grobid ('grobid'). Large PDFs are sharded by page range when
+    GROBID_SHARD_PAGES is set. Otherwise the PDF is streamed from S3 straight into
+    the upload to Grobid.
+    """
+    if GROBID_SHARD_PAGES <= 0 and not PDF_TRIAGE:
+        response = post_to_grobid(pdf_file, lambda: open_s3_pdf(bucket_name, pdf_file), limiter)
+        return response.status_code, response.content, "grobid"
+
+    # Triage and page splitting need the whole PDF in memory
+    body, _ = open_s3_pdf(bucket_name, pdf_file)
+    try:
+        pdf_content = body.read()
+    finally:
+        body.close()
+    pdf_md5 = hashlib.md5(pdf_content).hexdigest()
+
+    if PDF_TRIAGE:
+        decision = triage_pdf(pdf_content)
+        print(f"Triage {pdf_file}: route={decision['route']} ({decision['reason']}; pages={decision['pages']}, "
+              f"chars/page={decision['chars_per_page']}, outline entries={decision['outline_entries']})")
+        if decision['route'] == 'pypdf':
+            return 200, build_tei_from_pdf(pdf_content, pdf_md5), "pypdf"
+
+    if GROBID_SHARD_PAGES <= 0 or count_pdf_pages(pdf_content) <= GROBID_SHARD_PAGES:
+        response = post_to_grobid(pdf_file, lambda: open_pdf_bytes(pdf_content), limiter)
+        return response.status_code, response.content, "grobid"
+
+    shards = split_pdf(pdf_content, GROBID_SHARD_PAGES)
+    print(f"Split {pdf_file} into {len(shards)} shards of up to {GROBID_SHARD_PAGES} pages")
+    # Shard calls still go through the shared limiter, so they don't overload Grobid
+    with ThreadPoolExecutor(max_workers=min(len(shards), max(1, GROBID_CONCURRENCY))) as executor:
+        responses = list(executor.map(
+            lambda shard: post_to_grobid(pdf_file, lambda: open_pdf_bytes(shard), limiter), shards))
+    for response in responses:
+        if response.status_code != 200:
+            return response.status_code, None, "grobid"
+    return 200, merge_tei_shards([response.content for response in responses], pdf_md5), "grobid"
 
-def process_files_with_grobid(bucket_name):
-    """Process PDF files from S3 bucket with Grobid and save XML outputs locally."""
-    pdf_files = list_s3_objects(bucket_name)
+def process_pdf_with_grobid(bucket_name, pdf_file, xml_output_dir, txt_output_dir, cache=None, grobid_version="unknown",
+                            etag=None, limiter=None):
+    """Send one PDF from S3 through Grobid and save the XML/TXT outputs."""
+    start = time.perf_counter()
+    result = {"file": pdf_file, "status": "failed", "detail": "", "cached": False, "route": None}
+    xml_filename = f"Grobid_{os.path.basename(pdf_file).replace('.pdf', '')}_combined.xml"
+    xml_filepath = os.path.join(xml_output_dir, xml_filename)
+    try:
+        cache_key = None
+        if cache is not None:
+            # The ETag identifies the object's content without downloading it
+            if etag is None:
+                etag = s3_client.head_object(Bucket=bucket_name, Key=pdf_file)["ETag"]
+            etag = etag.strip('"').lower()
+            # Sharding and triage change the TEI produced, so their settings are part of the key
+            cache_key = GrobidCache.make_key(etag, grobid_version, {**GROBID_OPTIONS, "shard_pages": GROBID_SHARD_PAGES,
+                                                                    "triage": PDF_TRIAGE})
+            cached = cache.get(cache_key)
+            if cached is not None:
+                xml_content, txt_content = cached
+                with open(xml_filepath, 'wb') as f:
+                    f.write(xml_content)
+                txt_filepath = os.path.join(txt_output_dir, xml_filename.replace('.xml', '.txt'))
+                with open(txt_filepath, 'w', encoding='utf-8') as f:
+                    f.write(txt_content)
+                print(f"Reused cached Grobid output for {pdf_file}")
+                result.update(status="success", detail=xml_filepath, cached=True)
+                result["seconds"] = round(time.perf_counter() - start, 2)
+                return result
+
+        status_code, xml_content, result["route"] = run_grobid(bucket_name, pdf_file, limiter)
+
+        if status_code == 200:
+            # Save the Grobid output to an XML file
+            with open(xml_filepath, 'wb') as f:
+                f.write(xml_content)
+            print(f"Processed {pdf_file} ({result['route']}) and saved XML output to {xml_filepath}")
+
+            # Convert XML to TXT and save
+            txt_filepath = convert_xml_to_txt(xml_filepath, txt_output_dir)
+            result["status"] = "success"
+
+            if cache_key and txt_filepath:
+                # Single-part ETags are the PDF's MD5; skip caching if Grobid saw different bytes
+                tei_md5 = extract_tei_md5(xml_content)
+                if '-' in etag or tei_md5 in (None, etag):
+                    with open(txt_filepath, encoding='utf-8') as f:
+                        cache.put(cache_key, pdf_file, xml_content, f.read())
+                else:
+                    print(f"Not caching {pdf_file}: TEI MD5 {tei_md5} does not match ETag {etag}")
+            result["detail"] = xml_filepath
+        else:
+            result["detail"] = f"Status code: {status_code}"
+            print(f"Failed to process {pdf_file} with Grobid. Status code: {status_code}")
+    except Exception as e:
+        result["detail"] = str(e)
+        print(f"Error processing {pdf_file}: {e}")
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    return result
+
+def process_files_with_grobid(bucket_name, concurrency=GROBID_CONCURRENCY, use_cache=True, incremental=True):
+    """Process PDF files from S3 bucket with Grobid and save XML outputs locally.
+
+    Up to `concurrency` documents are processed at a time so S3 downloads, Grobid
+    calls and disk writes of different PDFs overlap, while an adaptive limiter keeps
+    the number of concurrent Grobid calls at what the server can sustain. PDFs
+    whose content, Grobid version and options match a cached entry reuse the stored
+    outputs. With `incremental`, only PDFs that are new or changed since the last
+    successful run are scheduled. Returns one result per scheduled PDF.
+    """
+    grobid_version = get_grobid_version()
+    pdf_objects = list(list_s3_pdf_objects(bucket_name))
+    manifest = None
+    if incremental:
+        manifest = IngestionManifest(GROBID_MANIFEST_PATH)
+        listed = len(pdf_objects)
+        pdf_objects = manifest.filter_changed(pdf_objects, grobid_version)
+        print(f"Ingestion manifest: {len(pdf_objects)} new or changed of {listed} PDFs in {bucket_name}")
     
     # Ensure the output directories exist
     xml_output_dir = "xml"
     txt_output_dir = "txt"
     os.makedirs(xml_output_dir, exist_ok=True)
     os.makedirs(txt_output_dir, exist_ok=True)
-    
-    for pdf_file in pdf_files:
-        # Download PDF file from S3
-        response = s3_client.get_object(Bucket=bucket_name, Key=pdf_file)
-        pdf_content = response['Body'].read()
-        
-        # Prepare the request to Grobid
-        files = {'input': (pdf_file, BytesIO(pdf_content), 'application/pdf')}
-        response = requests.post("http://host.docker.internal:8070/api/processFulltextDocument", files=files)
-        
-        if response.status_code == 200:
-            # Save the Grobid output to an XML file
-            xml_filename = f"Grobid_{os.path.basename(pdf_file).replace('.pdf', '')}_combined.xml"
-            xml_filepath = os.path.join(xml_output_dir, xml_filename)
-            with open(xml_filepath, 'wb') as f:
-                f.write(response.content)
-            print(f"Processed {pdf_file} and saved XML output to {xml_filepath}")
-            
-            # Convert XML to TXT and save
-            convert_xml_to_txt(xml_filepath, txt_output_dir)
-        else:
-            print(f"Failed to process {pdf_file} with Grobid. Status code: {response.status_code}")
+
+    cache = None
+    if use_cache:
+        cache = GrobidCache(GROBID_CACHE_DIR, max_bytes=GROBID_CACHE_MAX_MB * 1024 * 1024,
+                            max_age_days=GROBID_CACHE_MAX_AGE_DAYS)
+
+    limiter = AdaptiveConcurrencyLimiter(max(1, concurrency // 2), max(1, concurrency),
+                                         target_latency=GROBID_TARGET_LATENCY)
+
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(process_pdf_with_grobid, bucket_name, obj["Key"], xml_output_dir, txt_output_dir,
+                            cache, grobid_version, obj.get("ETag"), limiter): obj
+            for obj in pdf_objects
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            # Failed documents keep their old watermark and are retried on the next run
+            if manifest is not None and result["status"] == "success":
+                manifest.mark_processed(futures[future], grobid_version)
+
+    succeeded = [r for r in results if r["status"] == "success"]
+    failed = [r for r in results if r["status"] != "success"]
+    print(f"Grobid processing finished in {time.perf_counter() - start:.2f}s "
+          f"(concurrency={concurrency}): {len(succeeded)} succeeded, {len(failed)} failed")
+    if PDF_TRIAGE:
+        routed = [r["route"] for r in results if r["route"]]
+        print(f"Triage routing: {routed.count('pypdf')} via PyPDF fast path, {routed.count('grobid')} via Grobid")
+    print(f"Grobid concurrency limit ended at {int(limiter.limit)} after {limiter.overloads} overload responses")
+    for r in failed:
+        print(f"  FAILED {r['file']} ({r['seconds']}s): {r['detail']}")
+    if manifest is not None:
+        manifest.save()
+    if cache is not None:
+        cache.save()
+        print(f"Grobid cache: {cache.stats()}")
+    return results
 
 def convert_xml_to_txt(xml_file_path, txt_output_dir):
     """Converts an XML file to a TXT file and saves it in the specified directory."""
     try:
-        tree = ElementTree.parse(xml_file_path)
-        root = tree.getroot()
-        # Extract text from XML. This is a basic example and might need to be adjusted based on your XML structure.
-        text_content = '\n'.join(elem.text for elem in root.iter() if elem.text)
-        
         txt_filename = os.path.basename(xml_file_path).replace('.xml', '.txt')
         txt_filepath = os.path.join(txt_output_dir, txt_filename)
-        
+
+        # Stream the text of every element to the file in a single incremental parse
         with open(txt_filepath, 'w', encoding='utf-8') as txt_file:
-            txt_file.write(text_content)
+            TEIExtractor(xml_file_path).extract(text_file=txt_file)
         print(f"Converted {xml_file_path} to TXT and saved to {txt_filepath}")
+        return txt_filepath
     except Exception as e:
         print(f"Error converting XML to TXT for {xml_file_path}: {e}")
 
-process_files_with_grobid(S3_BUCKET_NAME)
+if __name__ == "__main__":
+    waited = wait_for_grobid(GROBID_URL, timeout=GROBID_READY_TIMEOUT)
+    print(f"Grobid is ready at {GROBID_URL} (waited {waited:.1f}s)")
+    process_files_with_grobid(S3_BUCKET_NAME)
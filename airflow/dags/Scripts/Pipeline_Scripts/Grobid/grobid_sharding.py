@@ -0,0 +1,82 @@
+from io import BytesIO
+from xml.etree import ElementTree
+from PyPDF2 import PdfReader, PdfWriter
+
+TEI_NS = 'http://www.tei-c.org/ns/1.0'
+NAMESPACES = {'tei': TEI_NS}
+
+# Keep TEI as the default namespace when the merged document is serialized
+ElementTree.register_namespace('', TEI_NS)
+ElementTree.register_namespace('xlink', 'http://www.w3.org/1999/xlink')
+
+
+def count_pdf_pages(pdf_content):
+    return len(PdfReader(BytesIO(pdf_content)).pages)
+
+
+def split_pdf(pdf_content, pages_per_shard):
+    """Split a PDF into consecutive page-range shards of at most `pages_per_shard` pages."""
+    reader = PdfReader(BytesIO(pdf_content))
+    shards = []
+    for start in range(0, len(reader.pages), pages_per_shard):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + pages_per_shard]:
+            writer.add_page(page)
+        buffer = BytesIO()
+        writer.write(buffer)
+        shards.append(buffer.getvalue())
+    return shards
+
+
+def _append_divs(target, elements):
+    """Append shard elements to `target`, continuing the previous section across a page-range cut."""
+    for i, element in enumerate(elements):
+        previous = target[-1] if len(target) else None
+        starts_without_head = (
+            i == 0
+            and element.tag == f'{{{TEI_NS}}}div'
+            and element.find('tei:head', NAMESPACES) is None
+        )
+        if starts_without_head and previous is not None and previous.tag == f'{{{TEI_NS}}}div':
+            # The shard begins mid-section: its paragraphs belong to the last section of the previous shard
+            previous.extend(list(element))
+        else:
+            target.append(element)
+
+
+def merge_tei_shards(shard_xmls, pdf_md5=None):
+    """Merge the TEI outputs of page-range shards (in page order) into one document.
+
+    The first shard provides the header. The body divs of later shards are appended in
+    order, and so is anything Grobid put in their abstract, since that is really body
+    text from the first page of the shard. Back matter divs are appended to the first
+    shard's <back>. `pdf_md5` replaces the shard MD5 in <idno type="MD5">.
+    """
+    roots = [ElementTree.fromstring(xml_content) for xml_content in shard_xmls]
+    base = roots[0]
+    text = base.find('tei:text', NAMESPACES)
+    body = text.find('tei:body', NAMESPACES)
+    back = text.find('tei:back', NAMESPACES)
+
+    for root in roots[1:]:
+        elements = []
+        abstract = root.find('.//tei:profileDesc/tei:abstract', NAMESPACES)
+        if abstract is not None:
+            elements.extend(list(abstract))
+        shard_body = root.find('tei:text/tei:body', NAMESPACES)
+        if shard_body is not None:
+            elements.extend(list(shard_body))
+        _append_divs(body, elements)
+
+        shard_back = root.find('tei:text/tei:back', NAMESPACES)
+        if shard_back is not None and len(shard_back):
+            if back is None:
+                back = ElementTree.SubElement(text, f'{{{TEI_NS}}}back')
+            back.extend(list(shard_back))
+
+    if pdf_md5:
+        idno = base.find('.//tei:idno[@type="MD5"]', NAMESPACES)
+        if idno is not None:
+            idno.text = pdf_md5.upper()
+
+    return ElementTree.tostring(base, encoding='utf-8', xml_declaration=True)
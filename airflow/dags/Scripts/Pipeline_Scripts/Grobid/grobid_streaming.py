@@ -0,0 +1,69 @@
+import uuid
+import requests
+from io import BytesIO
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 64 * 1024
+
+
+def create_grobid_session(pool_size):
+    """Session whose keep-alive connection pool is shared by all Grobid workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class MultipartPdfStream:
+    """multipart/form-data request body that reads the PDF from a file-like object as it is sent.
+
+    `body` can be an S3 StreamingBody, so the PDF never has to be held in memory.
+    The total length is known up front, which lets requests send a Content-Length
+    instead of chunked transfer encoding.
+    """
+
+    def __init__(self, field_name, filename, body, content_length, fields=None):
+        self.boundary = uuid.uuid4().hex
+        preamble = b''
+        for name, value in (fields or {}).items():
+            preamble += (
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'
+            ).encode('utf-8')
+        preamble += (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'
+        ).encode('utf-8')
+        epilogue = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+
+        self._parts = [BytesIO(preamble), body, BytesIO(epilogue)]
+        self._length = len(preamble) + content_length + len(epilogue)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(part.read() for part in self._parts)
+        data = b''
+        while self._parts and len(data) < size:
+            chunk = self._parts[0].read(size - len(data))
+            if chunk:
+                data += chunk
+            else:
+                self._parts.pop(0)
+        return data
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,142 @@
+import re
+from io import BytesIO
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from PyPDF2 import PdfReader
+
+# A text layer thinner than this (average characters per sampled page) needs Grobid's layout analysis
+MIN_CHARS_PER_PAGE = 200
+# Pages sampled to estimate text density
+SAMPLE_PAGES = 5
+# Minimum number of outline entries for the outline to be used as section structure
+MIN_OUTLINE_ENTRIES = 2
+
+# Control characters PDF text layers sometimes contain but XML 1.0 does not allow
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xml_text(text):
+    return escape(INVALID_XML_CHARS.sub(' ', text))
+
+
+def _flatten_outline(reader, outline, depth=0):
+    """Yield (depth, title, page_number, has_children) for outline entries in document order."""
+    for i, item in enumerate(outline):
+        if isinstance(item, list):
+            continue
+        children = outline[i + 1] if i + 1 < len(outline) and isinstance(outline[i + 1], list) else []
+        yield depth, str(item.title).strip(), reader.get_destination_page_number(item), bool(children)
+        yield from _flatten_outline(reader, children, depth + 1)
+
+
+def triage_pdf(pdf_content):
+    """Cheaply inspect a PDF and decide whether the PyPDF fast path can handle it.
+
+    Returns a dict with the route ('pypdf' or 'grobid'), the reason and the signals
+    it was based on (page count, text density, outline entries).
+    """
+    reader = PdfReader(BytesIO(pdf_content))
+    num_pages = len(reader.pages)
+    step = max(1, num_pages // SAMPLE_PAGES)
+    sampled = [reader.pages[i] for i in range(0, num_pages, step)][:SAMPLE_PAGES]
+    chars_per_page = sum(len((page.extract_text() or '').strip()) for page in sampled) / max(1, len(sampled))
+    try:
+        outline_entries = list(_flatten_outline(reader, reader.outline))
+    except Exception:
+        outline_entries = []
+
+    decision = {
+        'pages': num_pages,
+        'chars_per_page': round(chars_per_page),
+        'outline_entries': len(outline_entries),
+    }
+    if chars_per_page < MIN_CHARS_PER_PAGE:
+        decision.update(route='grobid', reason='sparse text layer')
+    elif len(outline_entries) < MIN_OUTLINE_ENTRIES:
+        decision.update(route='grobid', reason='no outline, section structure needs layout analysis')
+    else:
+        decision.update(route='pypdf', reason='dense text layer with outline headings')
+    return decision
+
+
+def build_tei_from_pdf(pdf_content, pdf_md5):
+    """Build a Grobid-shaped TEI document from the PDF's text layer and outline.
+
+    Outline entries with children become head-only divs (titles) and leaf entries
+    become divs with a head and the text up to the next heading, so grobid_csv
+    produces Title/Subtitle/Content rows for it exactly as for Grobid output.
+    """
+    reader = PdfReader(BytesIO(pdf_content))
+    entries = list(_flatten_outline(reader, reader.outline))
+
+    page_texts = [(page.extract_text() or '') + '\n' for page in reader.pages]
+    page_offsets = []
+    offset = 0
+    for page_text in page_texts:
+        page_offsets.append(offset)
+        offset += len(page_text)
+    text = ''.join(page_texts)
+    lowered = text.lower()
+
+    # Locate each heading in the text as (start, end), searching from its outline page onwards
+    positions = []
+    cursor = 0
+    for _, title, page_number, _ in entries:
+        start = max(cursor, page_offsets[page_number]) if 0 <= page_number < len(page_offsets) else cursor
+        found = lowered.find(title.lower(), start) if title else -1
+        if found < 0:
+            # Heading not in the text layer: the section starts where its page starts
+            positions.append((start, start))
+        else:
+            positions.append((found, found + len(title)))
+        cursor = positions[-1][1]
+
+    divs = []
+    for i, (_, title, _, has_children) in enumerate(entries):
+        head = f'<head>{_xml_text(title)}</head>'
+        if has_children:
+            divs.append(f'<div xmlns="http://www.tei-c.org/ns/1.0">{head}</div>')
+            continue
+        section_end = positions[i + 1][0] if i + 1 < len(entries) else len(text)
+        section_text = ' '.join(text[positions[i][1]:section_end].split())
+        divs.append(f'<div xmlns="http://www.tei-c.org/ns/1.0">{head}<p>{_xml_text(section_text)}</p></div>')
+
+    title = ''
+    if reader.metadata is not None and reader.metadata.title:
+        title = str(reader.metadata.title)
+
+    tei = f'''<?xml version="1.0" encoding="UTF-8"?>
+<TEI xml:space="preserve" xmlns="http://www.tei-c.org/ns/1.0">
+	<teiHeader xml:lang="en">
+		<fileDesc>
+			<titleStmt>
+				<title level="a" type="main">{_xml_text(title)}</title>
+			</titleStmt>
+			<publicationStmt>
+				<publisher/>
+				<availability status="unknown"><licence/></availability>
+			</publicationStmt>
+			<sourceDesc>
+				<biblStruct>
+					<idno type="MD5">{pdf_md5.upper()}</idno>
+				</biblStruct>
+			</sourceDesc>
+		</fileDesc>
+		<encodingDesc>
+			<appInfo>
+				<application ident="PyPDF2">
+					<desc>PyPDF2 fast path - text layer and outline extraction</desc>
+				</application>
+			</appInfo>
+		</encodingDesc>
+	</teiHeader>
+	<text xml:lang="en">
+		<body>
+{chr(10).join(divs)}
+		</body>
+	</text>
+</TEI>
+'''
+    # Fail here rather than in grobid_csv if the document is not well formed
+    ElementTree.fromstring(tei.encode('utf-8'))
+    return tei.encode('utf-8')
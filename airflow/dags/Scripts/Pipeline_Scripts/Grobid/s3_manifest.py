@@ -0,0 +1,59 @@
+import os
+import json
+from datetime import datetime
+
+
+class IngestionManifest:
+    """Watermark of the S3 PDFs already processed, persisted as JSON between runs.
+
+    Each key stores the ETag and LastModified it had when it was last processed
+    successfully, plus the Grobid version that processed it. Objects from a fresh
+    listing are only handed downstream when one of those has changed.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _watermark(obj, grobid_version):
+        last_modified = obj.get("LastModified")
+        if isinstance(last_modified, datetime):
+            last_modified = last_modified.isoformat()
+        return {
+            "etag": obj.get("ETag", "").strip('"').lower(),
+            "last_modified": last_modified,
+            "grobid_version": grobid_version,
+        }
+
+    def filter_changed(self, objects, grobid_version="unknown"):
+        """Return the objects from an S3 listing that are new or changed since the last run."""
+        changed = []
+        seen = set()
+        for obj in objects:
+            seen.add(obj["Key"])
+            entry = self.entries.get(obj["Key"])
+            if entry != self._watermark(obj, grobid_version):
+                changed.append(obj)
+        # Forget keys that were deleted from the bucket
+        for key in set(self.entries) - seen:
+            del self.entries[key]
+        return changed
+
+    def mark_processed(self, obj, grobid_version="unknown"):
+        """Record the watermark of an object that was processed successfully."""
+        self.entries[obj["Key"]] = self._watermark(obj, grobid_version)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
@@ -2,6 +2,8 @@ import os
 import tempfile
 import PyPDF2
 import boto3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,6 +16,10 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 # Hardcoded S3 bucket name
 S3_BUCKET_NAME = "bigdatas3team4"
 
+# Parallel page extraction: worker processes and pages handed to a worker at a time
+PYPDF_WORKERS = int(os.getenv("PYPDF_WORKERS", str(os.cpu_count() or 1)))
+PYPDF_PAGES_PER_TASK = int(os.getenv("PYPDF_PAGES_PER_TASK", "16"))
+
 # Initialize a boto3 client without specifying a region
 s3_client = boto3.client(
     's3',
@@ -37,32 +43,60 @@ def download_file_from_s3(bucket_name, object_name):
         s3_client.download_file(bucket_name, object_name, temp_file.name)
         return temp_file.name
 
-def extract_text_pypdf(s3_object_name, output_folder="PyPDF_Extracted"):
+def extract_page_range(pdf_path, start, end):
+    """Extract the text of pages [start, end) of a local PDF. Runs in a worker process."""
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[page_num].extract_text() for page_num in range(start, end)]
+
+def write_pdf_text(pdf_path, output_file, workers=PYPDF_WORKERS, pages_per_task=PYPDF_PAGES_PER_TASK):
+    """Write the text of every page of a local PDF to output_file, in page order.
+
+    Small PDFs (or workers <= 1) are written page by page as each is extracted. Large
+    PDFs are split into page ranges extracted on a process pool; only a few ranges per
+    worker are in flight at once and each is written out as soon as it is next in
+    order. Either way memory does not grow with the number of pages.
+    """
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        num_pages = len(reader.pages)
+        if workers <= 1 or num_pages <= pages_per_task:
+            for page in reader.pages:
+                output_file.write(page.extract_text())
+            return num_pages
+
+    ranges = [(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(extract_page_range, pdf_path, start, end))
+            if len(pending) >= workers * 2:
+                output_file.writelines(pending.popleft().result())
+        while pending:
+            output_file.writelines(pending.popleft().result())
+    return num_pages
+
+def extract_text_pypdf(s3_object_name, output_folder="PyPDF_Extracted", workers=PYPDF_WORKERS):
     """Extract text from a PDF file in S3 and save it to a local text file."""
     # Ensure the output_folder exists
     os.makedirs(output_folder, exist_ok=True)
-    text = ""
     
     # Download PDF from S3
     pdf_path = download_file_from_s3(S3_BUCKET_NAME, s3_object_name)
     
-    try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(reader.pages)):
-                text += reader.pages[page_num].extract_text()
-    except Exception as e:
-        print(f"Error reading PDF file {s3_object_name}: {e}")
-    finally:
-        os.remove(pdf_path)  # Clean up the temporary PDF file
-    
     output_filename = os.path.join(output_folder, f'{os.path.basename(s3_object_name)[:-4]}.txt')
     try:
         with open(output_filename, 'w') as file:
-            file.write(text)
+            # Page text is streamed to the file as it is extracted
+            try:
+                write_pdf_text(pdf_path, file, workers)
+            except Exception as e:
+                print(f"Error reading PDF file {s3_object_name}: {e}")
         print(f"Text extracted and saved to {output_filename}")
     except Exception as e:
         print(f"Error writing output file {output_filename}: {e}")
+    finally:
+        os.remove(pdf_path)  # Clean up the temporary PDF file
 
 def process_all_pdfs(bucket_name, output_folder="PyPDF"):
     """Process all PDF files in the specified S3 bucket."""
@@ -71,5 +105,6 @@ def process_all_pdfs(bucket_name, output_folder="PyPDF"):
             print(f"Processing {s3_object_name}...")
             extract_text_pypdf(s3_object_name, output_folder)
 
-# Example usage
-process_all_pdfs(S3_BUCKET_NAME)
+# Example usage (guarded so worker processes can import this module)
+if __name__ == "__main__":
+    process_all_pdfs(S3_BUCKET_NAME)
@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+
+
+def fingerprint(value):
+    """Stable sha256 of any JSON-serializable value."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def file_fingerprint(path, *extra):
+    """md5 of a file's contents, plus anything else that changes what loading it produces."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return fingerprint([md5.hexdigest(), *extra])
+
+
+def schema_fingerprint(df):
+    """Fingerprint of a DataFrame's column/dtype signature."""
+    return fingerprint([[str(col), str(dtype)] for col, dtype in df.dtypes.items()])
+
+
+class DDLCache:
+    """What the Snowflake target is known to look like, persisted as JSON between runs.
+
+    Holds the fingerprint of the warehouse/database/schema the environment DDL was last
+    run for, the schema fingerprint of each table created, and the fingerprint of the
+    file each table was last loaded from. DDL and loads are skipped while these match.
+    Everything is forgotten when the environment fingerprint changes.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = str(cache_path)
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            entries = {}
+        entries.setdefault('environment', None)
+        entries.setdefault('tables', {})
+        entries.setdefault('files', {})
+        return entries
+
+    def environment_changed(self, environment):
+        return self.entries['environment'] != fingerprint(environment)
+
+    def mark_environment(self, environment):
+        if self.environment_changed(environment):
+            self.entries = {'environment': fingerprint(environment), 'tables': {}, 'files': {}}
+
+    def schema_changed(self, table_name, df):
+        return self.entries['tables'].get(table_name.upper()) != schema_fingerprint(df)
+
+    def mark_schema(self, table_name, df):
+        self.entries['tables'][table_name.upper()] = schema_fingerprint(df)
+
+    def file_changed(self, table_name, file_fp):
+        return self.entries['files'].get(table_name.upper()) != file_fp
+
+    def mark_loaded(self, table_name, file_fp):
+        self.entries['files'][table_name.upper()] = file_fp
+
+    def forget(self, table_name):
+        self.entries['tables'].pop(table_name.upper(), None)
+        self.entries['files'].pop(table_name.upper(), None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.cache_path)
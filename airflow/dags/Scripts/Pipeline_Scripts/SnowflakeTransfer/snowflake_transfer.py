@@ -1,26 +1,61 @@
 import os
+import sys
+import time
+import queue
+import threading
+import requests
+import hashlib
+import tempfile
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import snowflake.connector
 from snowflake.connector.pandas_tools import write_pandas
 from pathlib import Path
+from ddl_cache import DDLCache, file_fingerprint
+
+# Add Pipeline_Scripts to sys.path for the helpers shared with grobid_csv.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from columnar import parquet_path_for as _columnar_parquet_path_for
 
 # Load environment variables
 dotenv_path = Path(__file__).parent / '.env'
 # Load environment variables
 load_dotenv(dotenv_path=dotenv_path)
 
-# Establish a connection to Snowflake
-conn = snowflake.connector.connect(
-    user=os.getenv('SNOWFLAKE_USER'),
-    password=os.getenv('SNOWFLAKE_PASSWORD'),
-    account=os.getenv('SNOWFLAKE_ACCOUNT'),
-    # The following parameters are placeholders and should be set as per your Snowflake setup.
-    warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
-    database=os.getenv('SNOWFLAKE_DATABASE'),
-    schema=os.getenv('SNOWFLAKE_SCHEMA'),
-    role= 'SYSADMIN',
-)
+# 'merge' applies only changed rows through a staging table; 'replace' recreates every table
+SNOWFLAKE_LOAD_MODE = os.getenv('SNOWFLAKE_LOAD_MODE', 'merge')
+# Load all tables through staged Parquet files and COPY INTO instead of one write_pandas per table
+SNOWFLAKE_BULK_LOAD = os.getenv('SNOWFLAKE_BULK_LOAD', '1') == '1'
+# Tables loaded concurrently, and upload threads per PUT
+SNOWFLAKE_LOAD_WORKERS = int(os.getenv('SNOWFLAKE_LOAD_WORKERS', '6'))
+SNOWFLAKE_PUT_THREADS = int(os.getenv('SNOWFLAKE_PUT_THREADS', '4'))
+# Rows per batch when streaming a Parquet or CSV file into a table (0 reads the whole file at once)
+SNOWFLAKE_CHUNK_ROWS = int(os.getenv('SNOWFLAKE_CHUNK_ROWS', '50000'))
+# Attempts per batch, and the first retry delay (doubled on every retry)
+SNOWFLAKE_UPLOAD_RETRIES = int(os.getenv('SNOWFLAKE_UPLOAD_RETRIES', '3'))
+SNOWFLAKE_UPLOAD_BACKOFF_SECONDS = float(os.getenv('SNOWFLAKE_UPLOAD_BACKOFF_SECONDS', '2'))
+
+# API endpoint whose query-result cache is invalidated after a load, e.g. http://fastapi:8095/snowflake/cache/invalidate
+QUERY_CACHE_INVALIDATE_URL = os.getenv('QUERY_CACHE_INVALIDATE_URL')
+QUERY_CACHE_TOKEN = os.getenv('QUERY_CACHE_TOKEN')
+
+# Fingerprints of the environment, table schemas and loaded files, so unchanged runs skip DDL and loads
+SNOWFLAKE_DDL_CACHE = os.getenv('SNOWFLAKE_DDL_CACHE', str(Path(__file__).parent / 'ddl_cache.json'))
+ddl_cache = DDLCache(SNOWFLAKE_DDL_CACHE)
+
+# Opened on first use by get_connection() and reused for every table
+_connection = None
+
+def _environment():
+    return {
+        'account': os.getenv('SNOWFLAKE_ACCOUNT'),
+        'warehouse': os.getenv('SNOWFLAKE_WAREHOUSE'),
+        'database': os.getenv('SNOWFLAKE_DATABASE'),
+        'schema': os.getenv('SNOWFLAKE_SCHEMA'),
+    }
 
 # Function to create a warehouse if it doesn't exist
 def create_warehouse_if_not_exists(conn, warehouse_name):
@@ -34,10 +69,43 @@ def create_database_if_not_exists(conn, database_name):
 def create_schema_if_not_exists(conn, schema_name):
     conn.cursor().execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name}")
 
-# Call the functions to ensure warehouse, database, and schema exist
-create_warehouse_if_not_exists(conn, os.getenv('SNOWFLAKE_WAREHOUSE'))
-create_database_if_not_exists(conn, os.getenv('SNOWFLAKE_DATABASE'))
-create_schema_if_not_exists(conn, os.getenv('SNOWFLAKE_SCHEMA'))
+# Ensure warehouse, database, and schema exist, unless they were already created for this environment
+def ensure_environment(conn):
+    environment = _environment()
+    if not ddl_cache.environment_changed(environment):
+        return
+    create_warehouse_if_not_exists(conn, environment['warehouse'])
+    create_database_if_not_exists(conn, environment['database'])
+    create_schema_if_not_exists(conn, environment['schema'])
+    ddl_cache.mark_environment(environment)
+    ddl_cache.save()
+
+# Open a new Snowflake session
+def connect_snowflake():
+    return snowflake.connector.connect(
+        user=os.getenv('SNOWFLAKE_USER'),
+        password=os.getenv('SNOWFLAKE_PASSWORD'),
+        account=os.getenv('SNOWFLAKE_ACCOUNT'),
+        # The following parameters are placeholders and should be set as per your Snowflake setup.
+        warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
+        database=os.getenv('SNOWFLAKE_DATABASE'),
+        schema=os.getenv('SNOWFLAKE_SCHEMA'),
+        role= 'SYSADMIN',
+    )
+
+# Establish a connection to Snowflake the first time one is needed
+def get_connection():
+    global _connection
+    if _connection is None:
+        _connection = connect_snowflake()
+        ensure_environment(_connection)
+    return _connection
+
+def close_connection():
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
 
 # Function to map pandas data types to Snowflake SQL types
 def pandas_dtype_to_snowflake_sql_type(dtype):
@@ -52,40 +120,478 @@ def pandas_dtype_to_snowflake_sql_type(dtype):
 
 # Function to dynamically create tables based on DataFrame's structure
 def create_table_from_df(df, table_name, conn):
+    if not ddl_cache.schema_changed(table_name, df):
+        # Same column/dtype signature as the table already created: only the rows need to go
+        conn.cursor().execute(f"TRUNCATE TABLE {table_name}")
+        return
     column_definitions = ', '.join([f'"{col.upper()}" {pandas_dtype_to_snowflake_sql_type(str(dtype))}' for col, dtype in df.dtypes.items()])
     create_table_sql = f"CREATE OR REPLACE TABLE {table_name} ({column_definitions})"
     conn.cursor().execute(create_table_sql)
+    ddl_cache.mark_schema(table_name, df)
+
+# Incremental loading: stage the batch, then apply only the changed rows to the target table
+
+ROW_HASH_COLUMN = 'ROW_HASH'
+
+def add_row_hash(df, occurrences=None):
+    """Add a ROW_HASH column: a stable hash of the row's values.
+
+    Identical rows are told apart by their occurrence number (1st, 2nd, ... copy),
+    so the key is unique and unchanged rows keep the same hash from run to run.
+    When a table arrives in chunks, pass the same `occurrences` dict for every chunk
+    so the numbering continues across them.
+    """
+    values = df.fillna('').astype(str).agg('\x1f'.join, axis=1)
+    if occurrences is None:
+        occurrence = values.groupby(values).cumcount().astype(str)
+    else:
+        occurrence = []
+        for value in values:
+            # Keyed by digest: the counts stay small however long the rows are
+            key = hashlib.md5(value.encode('utf-8')).digest()
+            occurrence.append(occurrences.get(key, 0))
+            occurrences[key] = occurrence[-1] + 1
+    df = df.copy()
+    df[ROW_HASH_COLUMN] = [
+        hashlib.sha256(f'{value}\x1e{n}'.encode('utf-8')).hexdigest()
+        for value, n in zip(values, occurrence)
+    ]
+    return df
+
+def _table_columns(conn, table_name):
+    """Column names of an existing table, or None if it does not exist."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM {table_name} LIMIT 0")
+    except Exception:
+        return None
+    return [column[0].upper() for column in cursor.description]
+
+def _is_snowflake(conn):
+    return isinstance(conn, snowflake.connector.SnowflakeConnection)
+
+def _create_stage_table(conn, df, table_name):
+    """(Re)create the empty staging table for a batch. Returns its name."""
+    stage_name = f'{table_name}__STAGE'
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {stage_name}")
+    column_definitions = ', '.join(f'"{col}" {pandas_dtype_to_snowflake_sql_type(str(dtype))}' for col, dtype in df.dtypes.items())
+    cursor.execute(f"CREATE TABLE {stage_name} ({column_definitions})")
+    return stage_name
 
-# Function to upload a CSV file to Snowflake
-def upload_csv_to_snowflake(csv_path, table_name, conn):
-    df = pd.read_csv(csv_path)
+def _apply_stage(conn, table_name, stage_name, columns, row_count, replace=False):
+    """Make the target table match the loaded staging table, then drop the staging table.
+
+    Rows whose ROW_HASH is no longer staged are deleted and rows with a new ROW_HASH are
+    inserted, in one transaction. A missing table, one whose columns changed, or
+    replace=True swaps in the staging table as a whole (ALTER TABLE ... SWAP WITH on Snowflake).
+    """
+    cursor = conn.cursor()
+    target_columns = _table_columns(conn, table_name)
+    if replace or target_columns != list(columns):
+        # First load or schema change: the staging table becomes the table
+        ddl_cache.forget(table_name)
+        if target_columns is None:
+            cursor.execute(f"ALTER TABLE {stage_name} RENAME TO {table_name}")
+        elif _is_snowflake(conn):
+            cursor.execute(f"ALTER TABLE {table_name} SWAP WITH {stage_name}")
+            cursor.execute(f"DROP TABLE {stage_name}")
+        else:
+            cursor.execute("BEGIN")
+            cursor.execute(f"DROP TABLE {table_name}")
+            cursor.execute(f"ALTER TABLE {stage_name} RENAME TO {table_name}")
+            cursor.execute("COMMIT")
+        print(f"Table {table_name} (re)created with {row_count} rows")
+        return {'inserted': row_count, 'deleted': 0, 'unchanged': 0}
+
+    column_list = ', '.join(f'"{col}"' for col in columns)
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute(
+            f'DELETE FROM {table_name} WHERE "{ROW_HASH_COLUMN}" NOT IN (SELECT "{ROW_HASH_COLUMN}" FROM {stage_name})'
+        )
+        deleted = max(cursor.rowcount or 0, 0)
+        cursor.execute(
+            f'INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {stage_name} '
+            f'WHERE "{ROW_HASH_COLUMN}" NOT IN (SELECT "{ROW_HASH_COLUMN}" FROM {table_name})'
+        )
+        inserted = max(cursor.rowcount or 0, 0)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.execute(f"DROP TABLE IF EXISTS {stage_name}")
+
+    summary = {'inserted': inserted, 'deleted': deleted, 'unchanged': row_count - inserted}
+    print(f"Table {table_name}: {summary['inserted']} inserted, {summary['deleted']} deleted, "
+          f"{summary['unchanged']} unchanged")
+    return summary
+
+def merge_df_into_table(df, table_name, conn, write_df=write_pandas):
+    """Load `df` into `table_name` incrementally.
+
+    The batch is written to a staging table (via `write_df`, write_pandas by default)
+    and then, in one transaction, rows whose ROW_HASH is no longer in the batch are
+    deleted and rows whose ROW_HASH is new are inserted. Unchanged rows are not
+    touched, and readers see either the old or the new contents, never an empty table.
+    A missing table, or one whose columns changed, is replaced by the staging table
+    in one step (ALTER TABLE ... SWAP WITH on Snowflake).
+
+    Any DB-API connection running this SQL can stand in for Snowflake, e.g. sqlite3
+    with write_df=lambda conn, df, name: df.to_sql(name, conn, if_exists='append', index=False).
+    """
+    table_name = table_name.upper()
+    df = add_row_hash(df)
+    stage_name = _create_stage_table(conn, df, table_name)
+    write_df(conn, df, stage_name)
+    return _apply_stage(conn, table_name, stage_name, df.columns, len(df))
+
+# Load a DataFrame according to SNOWFLAKE_LOAD_MODE
+def load_df_to_snowflake(df, table_name, conn):
     df.columns = [col.upper() for col in df.columns]
-    create_table_from_df(df, table_name, conn)
-    write_pandas(conn, df, table_name.upper())
+    if SNOWFLAKE_LOAD_MODE == 'merge':
+        merge_df_into_table(df, table_name, conn)
+    else:
+        create_table_from_df(df, table_name, conn)
+        write_pandas(conn, df, table_name.upper())
     print("Data Transfer Completed for table:", table_name)
 
+# Run one upload step, retrying transient failures with exponential backoff.
+# `landed`, when given, tells whether a failed attempt took effect anyway; it is then not repeated.
+def with_retries(action, description, landed=None):
+    for attempt in range(1, SNOWFLAKE_UPLOAD_RETRIES + 1):
+        try:
+            return action()
+        except Exception as e:
+            if landed is not None and _check_landed(landed):
+                print(f"{description} failed ({e}) after its rows were loaded, not retrying")
+                return None
+            if attempt == SNOWFLAKE_UPLOAD_RETRIES:
+                raise
+            delay = SNOWFLAKE_UPLOAD_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            print(f"{description} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def _check_landed(landed):
+    try:
+        return landed()
+    except Exception:
+        # Unknown (e.g. the connection is down too): retrying is the only option
+        return False
+
+def _row_count(conn, table_name):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    return cursor.fetchone()[0]
+
+# Write one batch with retries. write_pandas can fail after its COPY committed (e.g. the reply
+# was lost); with `rows_before`, the table's row count before this batch, such a batch is not
+# written a second time, which would duplicate its rows (and ROW_HASHes in a staging table).
+def write_with_retries(conn, df, table_name, write_df=write_pandas, rows_before=None):
+    landed = (lambda: _row_count(conn, table_name) == rows_before + len(df)) if rows_before is not None else None
+    return with_retries(lambda: write_df(conn, df, table_name), f"Writing {len(df)} rows to {table_name}", landed)
+
+def iter_table_chunks(path, chunk_rows=SNOWFLAKE_CHUNK_ROWS):
+    """DataFrames of at most `chunk_rows` rows (0: the whole file) with upper-case columns.
+
+    A CSV path is read from its Parquet copy when grobid_csv wrote one, batch by batch
+    with ParquetFile.iter_batches; otherwise the CSV is read in chunks with every column
+    as a string (no per-chunk type inference that could disagree between chunks).
+    Memory stays at one chunk. An empty file still yields one empty DataFrame, so its
+    table is emptied like any other.
+    """
+    path = Path(path)
+    parquet_file_path = parquet_path_for(path) if path.suffix == '.csv' else path
+    if parquet_file_path.exists():
+        parquet_file = pq.ParquetFile(parquet_file_path)
+        if chunk_rows > 0:
+            chunks = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_rows))
+        else:
+            chunks = iter([parquet_file.read().to_pandas()])
+        empty = parquet_file.schema_arrow.empty_table().to_pandas()
+    else:
+        chunks = pd.read_csv(path, dtype=str, chunksize=chunk_rows) if chunk_rows > 0 else iter([pd.read_csv(path, dtype=str)])
+        empty = pd.read_csv(path, dtype=str, nrows=0)
+
+    for df in chunks:
+        df.columns = [col.upper() for col in df.columns]
+        empty = None
+        yield df
+    if empty is not None:
+        empty.columns = [col.upper() for col in empty.columns]
+        yield empty
+
+def upload_chunks(chunks, table_name, conn, write_df=write_pandas):
+    """Load DataFrame chunks (see iter_table_chunks) into a table, so memory stays at one chunk.
+
+    Each chunk is written with retries and reported with its throughput. In merge mode
+    the chunks go to the staging table, which is applied once at the end; otherwise the
+    table is (re)created from the first chunk and the chunks are appended.
+    """
+    table_name = table_name.upper()
+    merge = SNOWFLAKE_LOAD_MODE == 'merge'
+    occurrences = {}
+    target_name = None
+    columns = None
+    total_rows = 0
+    start = time.perf_counter()
+    try:
+        for i, df in enumerate(chunks, 1):
+            chunk_start = time.perf_counter()
+            if merge:
+                df = add_row_hash(df, occurrences)
+            if target_name is None:
+                if merge:
+                    target_name = _create_stage_table(conn, df, table_name)
+                else:
+                    create_table_from_df(df, table_name, conn)
+                    target_name = table_name
+                columns = list(df.columns)
+            if len(df):
+                # The target starts empty (staging table, new or truncated table), so it holds total_rows so far
+                write_with_retries(conn, df, target_name, write_df, rows_before=total_rows)
+            total_rows += len(df)
+            chunk_seconds = time.perf_counter() - chunk_start
+            print(f"{table_name} chunk {i}: {len(df)} rows in {chunk_seconds:.2f}s "
+                  f"({len(df) / chunk_seconds if chunk_seconds else 0:.0f} rows/s), {total_rows} rows so far")
+    except Exception:
+        if merge and target_name is not None:
+            # The target was not touched; only the partial staging table has to go
+            conn.cursor().execute(f"DROP TABLE IF EXISTS {target_name}")
+        raise
+
+    if merge:
+        _apply_stage(conn, table_name, target_name, columns, total_rows)
+    seconds = time.perf_counter() - start
+    print(f"Data Transfer Completed for table: {table_name} ({total_rows} rows in {seconds:.2f}s, "
+          f"{total_rows / seconds if seconds else 0:.0f} rows/s)")
+
+# Function to upload a CSV file to Snowflake (streamed from its Parquet copy when grobid_csv wrote one)
+def upload_csv_to_snowflake(csv_path, table_name, conn, chunk_rows=SNOWFLAKE_CHUNK_ROWS, write_df=write_pandas):
+    upload_chunks(iter_table_chunks(csv_path, chunk_rows), table_name, conn, write_df)
+
+# Function to upload a validated Parquet file (written by grobid_csv) to Snowflake, one batch at a time
+def upload_parquet_to_snowflake(parquet_path, table_name, conn, chunk_rows=SNOWFLAKE_CHUNK_ROWS, write_df=write_pandas):
+    upload_chunks(iter_table_chunks(parquet_path, chunk_rows), table_name, conn, write_df)
+
+# columnar.parquet_path_for (where grobid_csv.py writes the Parquet copy), as a Path
+def parquet_path_for(csv_path):
+    return Path(_columnar_parquet_path_for(csv_path))
+
+def discover_table_files(schema_dir):
+    """{table_name: csv path} for every table grobid_csv wrote under schema_dir (parsed_into_schema).
+
+    Tables are found from parsed_into_schema/<kind>/parquet/*.parquet, plus CSVs that
+    have no Parquet copy; the CSV path is returned either way, as changed_table_files expects.
+    """
+    schema_dir = Path(schema_dir)
+    table_files = {}
+    for parquet_file_path in sorted(schema_dir.glob('*/parquet/*.parquet')):
+        table_files[parquet_file_path.stem] = parquet_file_path.parent.parent / 'csv' / f'{parquet_file_path.stem}.csv'
+    for csv_file_path in sorted(schema_dir.glob('*/csv/*.csv')):
+        table_files.setdefault(csv_file_path.stem, csv_file_path)
+    return table_files
+
+def changed_table_files(table_files):
+    """{table_name: (path, fingerprint)} for the tables whose source file changed since it was last loaded."""
+    changed = {}
+    # Loads recorded for another account/database/schema say nothing about this one
+    environment_changed = ddl_cache.environment_changed(_environment())
+    for table_name, path in table_files.items():
+        source_path = parquet_path_for(path) if parquet_path_for(path).exists() else path
+        if not source_path.exists():
+            print(f"File not found: {path}")
+            continue
+        file_fp = file_fingerprint(source_path, SNOWFLAKE_LOAD_MODE)
+        if environment_changed or ddl_cache.file_changed(table_name, file_fp):
+            changed[table_name] = (path, file_fp)
+        else:
+            print(f"Unchanged since last load, skipping table: {table_name}")
+    return changed
+
+# Bulk loading: every table staged as compressed Parquet files (one per chunk), PUT and COPY INTO'd concurrently
+
+def bulk_load_table(table_name, chunks, conn, tmp_dir):
+    """Load one table through staged files: every chunk (see iter_table_chunks) is written
+    as a Parquet file and PUT, with retries, to the staging table's stage; one COPY INTO
+    then loads them all.
+
+    Memory stays at one chunk. Returns per-table stats (rows, bytes uploaded, seconds, rows/sec).
+    """
+    start = time.perf_counter()
+    table_name = table_name.upper()
+    occurrences = {}
+    stage_name = None
+    columns = None
+    rows = 0
+    file_bytes = 0
+    cursor = conn.cursor()
+    try:
+        for i, df in enumerate(chunks, 1):
+            chunk_start = time.perf_counter()
+            df = add_row_hash(df, occurrences)
+            if stage_name is None:
+                stage_name = _create_stage_table(conn, df, table_name)
+                columns = list(df.columns)
+            rows += len(df)
+            if not len(df):
+                continue
+
+            # Snappy: Parquet compression Snowflake's COPY reads natively
+            file_path = Path(tmp_dir) / f'{table_name}_{i}.parquet'
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), file_path, compression='snappy')
+            chunk_bytes = file_path.stat().st_size
+            with_retries(lambda: cursor.execute(
+                f"PUT 'file://{file_path.as_posix()}' @%{stage_name} "
+                f"AUTO_COMPRESS=FALSE OVERWRITE=TRUE PARALLEL={SNOWFLAKE_PUT_THREADS}"
+            ), f"Uploading {table_name} chunk {i}")
+            file_path.unlink()
+            file_bytes += chunk_bytes
+            chunk_seconds = time.perf_counter() - chunk_start
+            print(f"{table_name} chunk {i}: {len(df)} rows, {chunk_bytes / 1024:.1f} KiB staged in "
+                  f"{chunk_seconds:.2f}s, {rows} rows so far")
+
+        cursor.execute(
+            f"COPY INTO {stage_name} FROM @%{stage_name} "
+            f"FILE_FORMAT=(TYPE=PARQUET) MATCH_BY_COLUMN_NAME=CASE_SENSITIVE PURGE=TRUE"
+        )
+    except Exception:
+        if stage_name is not None:
+            # The target was not touched; only the partial staging table has to go
+            cursor.execute(f"DROP TABLE IF EXISTS {stage_name}")
+        raise
+    summary = _apply_stage(conn, table_name, stage_name, columns, rows,
+                           replace=SNOWFLAKE_LOAD_MODE != 'merge')
+
+    seconds = time.perf_counter() - start
+    summary.update(table=table_name, rows=rows, bytes=file_bytes, seconds=seconds,
+                   rows_per_second=rows / seconds if seconds else 0.0)
+    return summary
+
+def _bulk_load_file(table_name, path, conn, tmp_dir):
+    return bulk_load_table(table_name, iter_table_chunks(path), conn, tmp_dir)
+
+class TableLoadError(Exception):
+    """Raised by bulk_load_tables, after its summary, when tables failed; `summaries` has the ones that loaded."""
+
+    def __init__(self, failed, summaries):
+        super().__init__(f"{len(failed)} table(s) failed to load: {', '.join(failed)}")
+        self.failed = failed
+        self.summaries = summaries
+
+def bulk_load_tables(table_files, connect=connect_snowflake, workers=SNOWFLAKE_LOAD_WORKERS):
+    """Bulk load {table_name: csv path} with up to `workers` tables in flight. Returns stats in table order.
+
+    Tables whose source file is unchanged since their last load are skipped; when
+    nothing changed no connection is opened at all. Every table in flight has a session
+    of its own (opened with `connect`, at most `workers` of them): transactions belong
+    to the session, so a shared one would let one table's COMMIT or ROLLBACK apply to
+    another table's half-done merge.
+
+    A failed table does not stop the others, but TableLoadError is raised once they are
+    done, so the task fails and Airflow retries it.
+    """
+    start = time.perf_counter()
+    changed = changed_table_files(table_files)
+    if not changed:
+        print("Nothing to load")
+        return []
+
+    idle = queue.Queue()
+    opened = []
+    opened_lock = threading.Lock()
+    first = connect()
+    ensure_environment(first)
+    opened.append(first)
+    idle.put(first)
+
+    def load(table_name, path, tmp_dir):
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = connect()
+            with opened_lock:
+                opened.append(conn)
+        try:
+            return _bulk_load_file(table_name, path, conn, tmp_dir)
+        finally:
+            idle.put(conn)
+
+    results = {}
+    failed = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {
+                executor.submit(load, table_name, path, tmp_dir): table_name
+                for table_name, (path, _) in changed.items()
+            }
+            for future in as_completed(futures):
+                table_name = futures[future]
+                try:
+                    results[table_name] = future.result()
+                    ddl_cache.mark_loaded(table_name, changed[table_name][1])
+                except Exception as e:
+                    print(f"Error loading table {table_name}: {e}")
+                    failed.append(table_name)
+    finally:
+        for conn in opened:
+            conn.close()
+    ddl_cache.save()
+
+    summaries = [results[table_name] for table_name in table_files if table_name in results]
+    print('*************** Bulk Load Summary ***************')
+    for summary in summaries:
+        print(f"{summary['table']}: {summary['rows']} rows, {summary['bytes'] / 1024:.1f} KiB in "
+              f"{summary['seconds']:.2f}s ({summary['rows_per_second']:.0f} rows/s)")
+    total_seconds = time.perf_counter() - start
+    total_rows = sum(summary['rows'] for summary in summaries)
+    total_bytes = sum(summary['bytes'] for summary in summaries)
+    print(f"Loaded {len(summaries)}/{len(changed)} changed tables, {total_rows} rows, {total_bytes / 1024:.1f} KiB "
+          f"in {total_seconds:.2f}s ({total_rows / total_seconds if total_seconds else 0:.0f} rows/s)")
+    if failed:
+        raise TableLoadError(failed, summaries)
+    return summaries
+
+# Tell the API to drop its cached results for the tables that were just loaded
+def invalidate_query_cache(table_names):
+    if not QUERY_CACHE_INVALIDATE_URL or not table_names:
+        return
+    headers = {'X-Cache-Token': QUERY_CACHE_TOKEN} if QUERY_CACHE_TOKEN else {}
+    try:
+        response = requests.post(QUERY_CACHE_INVALIDATE_URL, json={'tables': [name.upper() for name in table_names]},
+                                 headers=headers, timeout=10)
+        response.raise_for_status()
+        print(f"Invalidated {response.json().get('invalidated')} cached API results")
+    except requests.RequestException as e:
+        # The cache entries still expire on their own; a failed notification must not fail the load
+        print(f"Could not invalidate the API query cache: {e}")
+
 if __name__ == "__main__":
     # project_root = Path(__file__).parent.parent
     project_root = Path(__file__).parents[2]
 
-    # Paths to CSV files
-    csv_files = {
-        'grobid_content_2024_l1_topics_combined_2': project_root / 'Pipeline_Scripts/parsed_into_schema/content/csv/grobid_content_2024_l1_topics_combined_2.csv',
-        'grobid_content_2024_l2_topics_combined_2': project_root / 'Pipeline_Scripts/parsed_into_schema/content/csv' / 'grobid_content_2024_l2_topics_combined_2.csv',
-        'grobid_content_2024_l3_topics_combined_2': project_root / 'Pipeline_Scripts/parsed_into_schema/content/csv' / 'grobid_content_2024_l3_topics_combined_2.csv',
-        'grobid_metadata_2024_l1_topics_combined_2': project_root / 'Pipeline_Scripts/parsed_into_schema/metadata/csv' / 'grobid_metadata_2024_l1_topics_combined_2.csv',
-        'grobid_metadata_2024_l2_topics_combined_2': project_root / 'Pipeline_Scripts/parsed_into_schema/metadata/csv' / 'grobid_metadata_2024_l2_topics_combined_2.csv',
-        'grobid_metadata_2024_l3_topics_combined_2': project_root / 'Pipeline_Scripts/parsed_into_schema/metadata/csv' / 'grobid_metadata_2024_l3_topics_combined_2.csv',
-        # ...
-    }
+    # Every table grobid_csv produced, whatever documents it found
+    csv_files = discover_table_files(project_root / 'Pipeline_Scripts/parsed_into_schema')
+    print(f"Found {len(csv_files)} tables to load")
 
-    # Process each CSV file
-    for table_name, csv_file_path in csv_files.items():
-        if csv_file_path.exists():
-            upload_csv_to_snowflake(csv_file_path, table_name, conn)
-            # print("Data Transfer Completed")
-        else:
-            print(f"File not found: {csv_file_path}")
+    if SNOWFLAKE_BULK_LOAD:
+        try:
+            loaded_tables = [summary['table'] for summary in bulk_load_tables(csv_files)]
+        except TableLoadError as e:
+            # The tables that did load still drop their cached API results before the task fails
+            invalidate_query_cache([summary['table'] for summary in e.summaries])
+            raise
+    else:
+        loaded_tables = []
+        # Process each changed CSV file
+        for table_name, (csv_file_path, file_fp) in changed_table_files(csv_files).items():
+            # Streamed from the Parquet copy when there is one, from the CSV otherwise
+            upload_csv_to_snowflake(csv_file_path, table_name, get_connection())
+            ddl_cache.mark_loaded(table_name, file_fp)
+            ddl_cache.save()
+            loaded_tables.append(table_name)
+    invalidate_query_cache(loaded_tables)
 
-    # Close the Snowflake connection
-    conn.close()
+    # Close the Snowflake connection, if one was needed
+    close_connection()
@@ -0,0 +1,88 @@
+import os
+import csv
+import sys
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Parquet files are the hand-off between extraction/validation and loading; CSV copies are optional
+PIPELINE_WRITE_CSV = os.getenv("PIPELINE_WRITE_CSV", "0") == "1"
+
+
+def models_to_table(models, model_class):
+    """Build an Arrow table (one string column per model field) from validated pydantic models."""
+    columns = list(model_class.__fields__.keys())
+    return pa.table(
+        {column: pa.array([getattr(model, column) for model in models], type=pa.string()) for column in columns}
+    )
+
+
+def parquet_path_for(csv_path):
+    """parsed_into_schema/<kind>/csv/<name>.csv -> parsed_into_schema/<kind>/parquet/<name>.parquet"""
+    csv_dir, csv_name = os.path.split(str(csv_path))
+    return os.path.join(os.path.dirname(csv_dir), 'parquet', os.path.splitext(csv_name)[0] + '.parquet')
+
+
+def write_parquet(table, parquet_path):
+    """Write a table atomically, so a crash never leaves a truncated file behind."""
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    tmp_path = parquet_path + '.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, parquet_path)
+
+
+def read_parquet(parquet_path):
+    return pq.read_table(parquet_path)
+
+
+def write_csv(table, csv_path):
+    """Write a table as CSV in the same format as the validators' csv.DictWriter output."""
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(table.column_names)
+        for batch in table.to_batches():
+            writer.writerows(zip(*(column.to_pylist() for column in batch.columns)))
+
+
+def benchmark(csv_paths, repeat=5):
+    """Compare the CSV round-trips of the current hand-off with a single Parquet write/read."""
+    import tempfile
+    import pandas as pd
+
+    for csv_path in csv_paths:
+        with open(csv_path, newline='', encoding='utf-8') as csvfile:
+            rows = list(csv.DictReader(csvfile))
+        columns = list(rows[0].keys()) if rows else []
+        table = pa.table({column: pa.array([row[column] for row in rows], type=pa.string()) for column in columns})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_csv = os.path.join(tmp_dir, 'content.csv')
+            tmp_parquet = os.path.join(tmp_dir, 'content.parquet')
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                # save_to_csv, validator read + rewrite, pd.read_csv in the loader
+                write_csv(table, tmp_csv)
+                with open(tmp_csv, newline='', encoding='utf-8') as csvfile:
+                    reread = list(csv.DictReader(csvfile))
+                with open(tmp_csv, 'w', newline='', encoding='utf-8') as csvfile:
+                    writer = csv.DictWriter(csvfile, fieldnames=columns)
+                    writer.writeheader()
+                    writer.writerows(reread)
+                pd.read_csv(tmp_csv)
+            csv_seconds = (time.perf_counter() - start) / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                write_parquet(table, tmp_parquet)
+                read_parquet(tmp_parquet).to_pandas()
+            parquet_seconds = (time.perf_counter() - start) / repeat
+
+        print(f"{os.path.basename(csv_path)} ({len(rows)} rows): CSV round-trips {csv_seconds * 1000:.1f} ms, "
+              f"Parquet hand-off {parquet_seconds * 1000:.1f} ms ({csv_seconds / parquet_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    # Usage: python columnar.py parsed_into_schema/content/csv/*.csv
+    benchmark(sys.argv[1:])
@@ -7,40 +7,59 @@ import os
 import re
 import csv
 import sys
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # Add the root directory to sys.path
 root_dir = str(Path(__file__).resolve().parent.parent)  # Adjust the number of parent calls as necessary
 sys.path.append(root_dir)
-from Scripts.Validation import ContentValidator, MetadataValidator
-
-FILENAME_MAPPING = {
-    'Grobid_2024-l1-topics-combined-2_combined.xml': {
-        'content_csv': 'grobid_content_2024_l1_topics_combined_2.csv',
-        'metadata_csv': 'grobid_metadata_2024_l1_topics_combined_2.csv'
-    },
-    'Grobid_2024-l2-topics-combined-2_combined.xml': {
-        'content_csv': 'grobid_content_2024_l2_topics_combined_2.csv',
-        'metadata_csv': 'grobid_metadata_2024_l2_topics_combined_2.csv'
-    },
-    'Grobid_2024-l3-topics-combined-2_combined.xml': {
-        'content_csv': 'grobid_content_2024_l3_topics_combined_2.csv',
-        'metadata_csv': 'grobid_metadata_2024_l3_topics_combined_2.csv'
+from Scripts.Validation import (Content, Metadata, validate_batch, new_summary, add_to_summary,
+                                format_summary, quarantine_path_for, write_quarantine)
+from tei_extractor import TEIExtractor
+from columnar import PIPELINE_WRITE_CSV, models_to_table, parquet_path_for, read_parquet, write_parquet, write_csv
+from search_index import SearchIndex, index_path_for
+
+# Number of TEI files converted in parallel
+GROBID_CSV_WORKERS = int(os.getenv("GROBID_CSV_WORKERS", str(os.cpu_count() or 1)))
+
+def output_names(xml_filename):
+    """Derive the content/metadata CSV names from a Grobid XML name.
+
+    e.g. Grobid_2024-l1-topics-combined-2_combined.xml ->
+         grobid_content_2024_l1_topics_combined_2.csv, grobid_metadata_2024_l1_topics_combined_2.csv
+    """
+    stem = os.path.basename(xml_filename)[len('Grobid_'):-len('_combined.xml')]
+    stem = re.sub(r'[^A-Za-z0-9]+', '_', stem).lower()
+    return {
+        'content_csv': f'grobid_content_{stem}.csv',
+        'metadata_csv': f'grobid_metadata_{stem}.csv'
     }
-}
 
 def remove_special_characters(s):
     return re.sub(r'[^A-Za-z0-9 ]+', '', s)
 
-def print_validation(validation_errors):
-    if validation_errors:
-        print("Validation Errors Encountered:")
-    for error in validation_errors:
-        print(f"Row: {error['row']}")
-        print(f"Error: {error['error']}\n")
-    else:
-        print("No validation errors encountered.")
+def print_validation(summary):
+    # Counters only: the rejected rows and their errors are in the quarantine file
+    print(f"Validation {format_summary(summary)}")
+
+def save_quarantine(errors, csv_path):
+    """Write the rejected rows of one output as JSONL; a clean run removes a stale quarantine file."""
+    quarantine_path = quarantine_path_for(csv_path)
+    if not errors:
+        if os.path.exists(quarantine_path):
+            os.remove(quarantine_path)
+        return None
+    os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+    with open(quarantine_path + '.tmp', 'w', encoding='utf-8') as quarantine_file:
+        write_quarantine(errors, quarantine_file)
+    os.replace(quarantine_path + '.tmp', quarantine_path)
+    return quarantine_path
+
 
+# The original three-parse extraction. The pipeline uses TEIExtractor instead; these two
+# classes are kept only as the reference that tei_extractor.benchmark() checks against.
 
 class ContentPDFClass:
     def __init__(self, file_path):
@@ -142,52 +161,116 @@ class MetadataPDFClass:
         }
         return metadata_dict
 
-def process_files(input_dir, output_dir):
-    for xml_filename, paths in FILENAME_MAPPING.items():
-        xml_file_path = os.path.join(input_dir, xml_filename).replace('\\','/')
-        content_pdf = ContentPDFClass(xml_file_path)
-        content_pdf.parse_xml_and_replace_symbols()
-        metadata_data = MetadataPDFClass(xml_file_path).extract_metadata()
+def process_file(xml_file_path, output_dir):
+    """Convert one Grobid XML file into validated content and metadata tables. Returns a timing summary.
 
-        content_csv_dir = os.path.join(output_dir, 'content', 'csv')
-        metadata_csv_dir = os.path.join(output_dir, 'metadata', 'csv')
-        os.makedirs(content_csv_dir, exist_ok=True)
-        os.makedirs(metadata_csv_dir, exist_ok=True)
+    Rows are validated in memory and the valid ones are written once, as Parquet
+    (plus CSV copies when PIPELINE_WRITE_CSV=1), for the Snowflake load stage.
+    """
+    start = time.perf_counter()
+    paths = output_names(xml_file_path)
 
-        # Save content and metadata to CSV
-        # content_csv_path = os.path.join(output_dir, 'content', 'csv', paths['content_csv'])
-        # metadata_csv_path = os.path.join(output_dir, 'metadata', 'csv', paths['metadata_csv'])
+    # One parse of the TEI produces both the content rows and the metadata
+    extractor = TEIExtractor(xml_file_path).extract(keep_text=False)
+    content_records = [
+        # Missing values become '' exactly as they would after a CSV round-trip
+        {'Title': title or '', 'Subtitle': subtitle or '', 'Content': content or ''}
+        for title, subtitle, content in extractor.rows
+    ]
+    metadata_records = [extractor.metadata]
 
-        content_csv_path = os.path.join(content_csv_dir, paths['content_csv'])
-        metadata_csv_path = os.path.join(metadata_csv_dir, paths['metadata_csv'])
+    content_csv_path = os.path.join(output_dir, 'content', 'csv', paths['content_csv'])
+    metadata_csv_path = os.path.join(output_dir, 'metadata', 'csv', paths['metadata_csv'])
 
-        # Writing Content & Metadata
-        content_pdf.save_to_csv(content_csv_path)
-        pd.DataFrame([metadata_data]).to_csv(metadata_csv_path, index=False)
+    # Validating all Content rows and saving clean files
+    valid_content, content_errors = validate_batch(Content, content_records)
+    content_table = models_to_table(valid_content, Content)
+    write_parquet(content_table, parquet_path_for(content_csv_path))
+    if PIPELINE_WRITE_CSV:
+        write_csv(content_table, content_csv_path)
 
-        # Validating all Content rows and saving clean files
-        content_class_instance = ContentValidator(str(content_csv_path), str(content_csv_path))
-        valid_topics, validation_errors = content_class_instance.clean_and_validate_content_csv()
-        
-        print('*************** Content Validation ***************')
-        print(f"Valid rows: {len(valid_topics)}, Validation errors: {len(validation_errors)}")
-        print_validation(validation_errors)
-        print()
-
-        # Validating all Metadata rows and saving clean files
-        metadata_class_instance = MetadataValidator(str(metadata_csv_path), str(metadata_csv_path))
-        valid_topics, validation_errors = metadata_class_instance.clean_and_validate_metadata_csv()
-        
-        print('*************** Metadata Validation ***************')
-        print(f"Valid rows: {len(valid_topics)}, Validation errors: {len(validation_errors)}")
-        print_validation(validation_errors)
-        print()
+    content_summary = add_to_summary(new_summary(), valid_content, content_errors)
+    content_summary['quarantine'] = save_quarantine(content_errors, content_csv_path)
+
+    print(f'*************** Content Validation: {os.path.basename(xml_file_path)} ***************')
+    print_validation(content_summary)
+    print()
 
+    # Validating all Metadata rows and saving clean files
+    valid_metadata, metadata_errors = validate_batch(Metadata, metadata_records)
+    metadata_table = models_to_table(valid_metadata, Metadata)
+    write_parquet(metadata_table, parquet_path_for(metadata_csv_path))
+    if PIPELINE_WRITE_CSV:
+        write_csv(metadata_table, metadata_csv_path)
+
+    metadata_summary = add_to_summary(new_summary(), valid_metadata, metadata_errors)
+    metadata_summary['quarantine'] = save_quarantine(metadata_errors, metadata_csv_path)
+
+    print(f'*************** Metadata Validation: {os.path.basename(xml_file_path)} ***************')
+    print_validation(metadata_summary)
+    print()
+
+    return {
+        'file': os.path.basename(xml_file_path),
+        # Indexed under the name of the table the rows are loaded into
+        'document': os.path.splitext(paths['content_csv'])[0],
+        'content_parquet': parquet_path_for(content_csv_path),
+        'content_rows': len(valid_content),
+        'content_errors': len(content_errors),
+        'metadata_errors': len(metadata_errors),
+        'seconds': time.perf_counter() - start,
+    }
+
+def process_files(input_dir, output_dir, workers=GROBID_CSV_WORKERS):
+    """Convert every Grobid_*_combined.xml in input_dir, spreading the files over a process pool.
+
+    Each document's content rows are added to the search index in output_dir as soon as
+    its file is done (read back from its Parquet file), so no more than one document's
+    rows are held here at a time.
+    """
+    xml_file_paths = sorted(path.replace('\\', '/') for path in glob.glob(os.path.join(input_dir, 'Grobid_*_combined.xml')))
+    print(f"Found {len(xml_file_paths)} Grobid XML files in {input_dir}")
+
+    start = time.perf_counter()
+    summaries = []
+    index = SearchIndex(index_path_for(output_dir))
+    indexed = []
+
+    def collect(summary):
+        summaries.append(summary)
+        # Only documents whose rows changed are re-indexed
+        if index.add_document(summary['document'], read_parquet(summary['content_parquet']).to_pylist()):
+            indexed.append(summary['document'])
+
+    if workers <= 1 or len(xml_file_paths) <= 1:
+        for xml_file_path in xml_file_paths:
+            try:
+                collect(process_file(xml_file_path, output_dir))
+            except Exception as e:
+                print(f"Error processing {xml_file_path}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process_file, path, output_dir): path for path in xml_file_paths}
+            for future in as_completed(futures):
+                try:
+                    collect(future.result())
+                except Exception as e:
+                    print(f"Error processing {futures[future]}: {e}")
+
+    print('*************** Timing Summary ***************')
+    for summary in sorted(summaries, key=lambda s: s['seconds'], reverse=True):
+        print(f"{summary['file']}: {summary['seconds']:.2f}s, {summary['content_rows']} content rows, "
+              f"{summary['content_errors']} content errors, {summary['metadata_errors']} metadata errors")
+    print(f"Processed {len(summaries)}/{len(xml_file_paths)} files in {time.perf_counter() - start:.2f}s "
+          f"with {workers} workers")
+
+    if indexed:
+        index.save()
+    print(f"Search index: {len(indexed)} of {len(summaries)} documents updated, {index.stats()}")
+    return summaries
 
 
 if __name__ == "__main__":
     input_dir = 'Grobid/xml'
     output_dir = 'parsed_into_schema'
     process_files(input_dir, output_dir)
-
-
@@ -0,0 +1,150 @@
+import os
+import re
+import sys
+import json
+import hashlib
+from collections import Counter
+
+# Index file read by the API (fastapi/restApi.py /search); by default search_index.json in grobid_csv's output_dir
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH")
+
+INDEX_VERSION = 1
+TOKEN_PATTERN = r'[a-z0-9]+'
+STOPWORDS = sorted({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'its',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'were', 'which', 'with',
+})
+# Title and subtitle terms count more than content terms
+FIELD_WEIGHTS = {'Title': 2, 'Subtitle': 2, 'Content': 1}
+
+
+def index_path_for(output_dir):
+    return SEARCH_INDEX_PATH or os.path.join(output_dir, 'search_index.json')
+
+
+def tokenize(text, pattern=re.compile(TOKEN_PATTERN), stopwords=frozenset(STOPWORDS)):
+    return [token for token in pattern.findall((text or '').lower()) if token not in stopwords]
+
+
+def weighted_terms(row):
+    """Term frequencies of a Title/Subtitle/Content row, with FIELD_WEIGHTS applied."""
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(row.get(field)):
+            terms[token] += weight
+    return terms
+
+
+def rows_fingerprint(rows):
+    return hashlib.sha256(json.dumps(rows, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SearchIndex:
+    """Inverted index over Title/Subtitle/Content rows, persisted as JSON for BM25 ranking.
+
+    Rows are grouped by document (the content table they were loaded into); adding a
+    document replaces its previous rows, and a document whose rows did not change is
+    left alone. Postings hold weighted term frequencies and every row keeps its length,
+    so the reader only needs the file to score queries. The tokenizer settings are
+    stored with the index so the reader tokenizes queries the same way.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = str(index_path)
+        self.entries = self._load()
+
+    def _empty(self):
+        return {
+            'version': INDEX_VERSION,
+            'tokenizer': {'pattern': TOKEN_PATTERN, 'stopwords': STOPWORDS, 'field_weights': FIELD_WEIGHTS},
+            'documents': {},
+            'rows': {},
+            'postings': {},
+            'total_length': 0,
+        }
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self._empty()
+        # Rebuilt from scratch when the tokenizer changed, since old postings would not match new queries
+        if entries.get('version') != INDEX_VERSION or entries.get('tokenizer') != self._empty()['tokenizer']:
+            return self._empty()
+        return entries
+
+    def add_document(self, doc_id, rows):
+        """Index a document's rows (dicts with Title/Subtitle/Content). Returns False if it was unchanged."""
+        rows = [{field: row.get(field) or '' for field in FIELD_WEIGHTS} for row in rows]
+        fingerprint = rows_fingerprint(rows)
+        if self.entries['documents'].get(doc_id, {}).get('fingerprint') == fingerprint:
+            return False
+        self.remove_document(doc_id)
+
+        row_ids = []
+        for i, row in enumerate(rows):
+            row_id = f'{doc_id}:{i}'
+            terms = weighted_terms(row)
+            for term, frequency in terms.items():
+                self.entries['postings'].setdefault(term, {})[row_id] = frequency
+            length = sum(terms.values())
+            self.entries['rows'][row_id] = {'doc': doc_id, **row, 'length': length}
+            self.entries['total_length'] += length
+            row_ids.append(row_id)
+        self.entries['documents'][doc_id] = {'fingerprint': fingerprint, 'rows': row_ids}
+        return True
+
+    def remove_document(self, doc_id):
+        document = self.entries['documents'].pop(doc_id, None)
+        if document is None:
+            return False
+        for row_id in document['rows']:
+            row = self.entries['rows'].pop(row_id)
+            self.entries['total_length'] -= row['length']
+            for term in weighted_terms(row):
+                postings = self.entries['postings'].get(term)
+                if postings is not None:
+                    postings.pop(row_id, None)
+                    if not postings:
+                        del self.entries['postings'][term]
+        return True
+
+    def stats(self):
+        return {
+            'documents': len(self.entries['documents']),
+            'rows': len(self.entries['rows']),
+            'terms': len(self.entries['postings']),
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+
+def update_index(documents, index_path):
+    """Add (doc_id, rows) pairs to the index on disk, one document at a time; it is only rewritten if one changed."""
+    index = SearchIndex(index_path)
+    changed = []
+    total = 0
+    for doc_id, rows in documents:
+        total += 1
+        if index.add_document(doc_id, rows):
+            changed.append(doc_id)
+    if changed:
+        index.save()
+    print(f"Search index: {len(changed)} of {total} documents updated, {index.stats()}")
+    return changed
+
+
+if __name__ == "__main__":
+    # Usage: python search_index.py parsed_into_schema/content/parquet/*.parquet
+    from columnar import read_parquet
+
+    update_index((
+        (os.path.splitext(os.path.basename(path))[0], read_parquet(path).to_pylist())
+        for path in sys.argv[1:]
+    ), index_path_for('parsed_into_schema'))
@@ -0,0 +1,202 @@
+import os
+import re
+import sys
+import time
+from xml.etree import ElementTree
+
+TEI_NS = 'http://www.tei-c.org/ns/1.0'
+NAMESPACES = {'tei': TEI_NS}
+
+def _tag(name):
+    return f'{{{TEI_NS}}}{name}'
+
+# Elements whose whole subtree is needed once they end; everything else is cleared as soon as it ends
+KEEP_SUBTREE = {_tag('div'), _tag('titleStmt'), _tag('publicationStmt'), _tag('application'), _tag('listBibl')}
+
+def remove_special_characters(s):
+    return re.sub(r'[^A-Za-z0-9 ]+', '', s)
+
+def replace_symbols_with_numbers(text, symbol):
+    parts = text.split(symbol)
+    return parts[0] + ''.join(f"{i}. {part}" for i, part in enumerate(parts[1:], 1))
+
+def _text_nodes(elem):
+    """Text nodes directly under an element, like the XPath text() step."""
+    nodes = [elem.text] + [child.tail for child in elem]
+    return [node for node in nodes if node]
+
+def _first_item(nodes):
+    if nodes:
+        return nodes[0].replace('\n', '').replace('\t', '').strip()
+    return "No Data"
+
+
+class TEIExtractor:
+    """Single-pass extraction of everything the pipeline needs from a Grobid TEI file.
+
+    One incremental iterparse produces, in the same pass:
+      - text:     the plain text written by grobid_process.convert_xml_to_txt
+      - rows:     the [Title, Subtitle, Content] rows of grobid_csv.ContentPDFClass
+      - metadata: the dict of grobid_csv.MetadataPDFClass.extract_metadata
+    Elements are cleared as soon as they end, except inside the few sections that
+    have to be inspected as a whole (divs, title/publication statements, ...), so
+    memory is bounded by the largest section rather than the document.
+    """
+
+    def __init__(self, xml_file_path):
+        self.xml_file_path = xml_file_path
+        self.text = None
+        self.rows = []
+        self.metadata = {}
+
+    def extract(self, text_file=None, keep_text=True):
+        """Parse the file once.
+
+        With `text_file` the plain text is streamed there instead of kept in memory;
+        with keep_text=False it is not produced at all.
+        """
+        text_parts = [] if text_file is None and keep_text else None
+        written = [False]
+
+        def emit_text(value):
+            if not value or (text_file is None and not keep_text):
+                return
+            if text_file is None:
+                text_parts.append(value)
+            else:
+                if written[0]:
+                    text_file.write('\n')
+                text_file.write(value)
+                written[0] = True
+
+        title_nodes, publisher_nodes, status_nodes = [], [], []
+        bibl_nodes, desc_nodes, abstract_texts = [], [], []
+        div_slots = []
+        slot_of = {}
+        current_title = ''
+
+        stack = []
+        keep_depth = 0
+        pending = None  # last started element whose text is not known yet
+
+        for event, elem in ElementTree.iterparse(self.xml_file_path, events=('start', 'end')):
+            if event == 'start':
+                # The parser has flushed the previous element's text by the time the next tag starts
+                if pending is not None:
+                    emit_text(pending.text)
+                pending = elem
+                if elem.tag == _tag('availability') and elem.get('status') is not None:
+                    status_nodes.append(elem.get('status'))
+                if elem.tag == _tag('div'):
+                    slot_of[elem] = len(div_slots)
+                    div_slots.append(None)
+                if elem.tag in KEEP_SUBTREE:
+                    keep_depth += 1
+                stack.append(elem)
+                continue
+
+            if pending is elem:
+                emit_text(elem.text)
+                pending = None
+            stack.pop()
+            parent = stack[-1] if stack else None
+            tags = [ancestor.tag for ancestor in stack]
+
+            if elem.tag == _tag('title') and parent is not None and parent.tag == _tag('titleStmt') \
+                    and elem.get('level') == 'a' and elem.get('type') == 'main':
+                title_nodes.extend(_text_nodes(elem))
+            elif elem.tag == _tag('publisher') and parent is not None and parent.tag == _tag('publicationStmt'):
+                publisher_nodes.extend(_text_nodes(elem))
+            elif elem.tag == _tag('desc') and parent is not None and parent.tag == _tag('application'):
+                desc_nodes.extend(_text_nodes(elem))
+            elif elem.tag == _tag('listBibl') and _tag('back') in tags:
+                bibl_nodes.extend(_text_nodes(elem))
+            elif elem.tag == _tag('div'):
+                if parent is not None and parent.tag == _tag('abstract') and len(stack) > 1 \
+                        and stack[-2].tag == _tag('profileDesc'):
+                    head_text = " ".join(node for head in elem.findall('tei:head', NAMESPACES)
+                                         for node in _text_nodes(head)).strip()
+                    p_texts = " ".join(node for p in elem.findall('tei:p', NAMESPACES) for node in _text_nodes(p)).strip()
+                    abstract_texts.append((head_text + " " + p_texts).strip())
+
+                head = elem.find('.//tei:head', NAMESPACES)
+                paragraphs = elem.findall('.//tei:p', NAMESPACES)
+                div_slots[slot_of.pop(elem)] = (
+                    head is not None,
+                    head.text if head is not None else None,
+                    [p.text for p in paragraphs if p.text],
+                    bool(paragraphs),
+                )
+                if _tag('div') not in tags:
+                    # Outermost div finished: all of its (nested) divs are known, in document order
+                    for slot in div_slots:
+                        current_title = self._add_row(current_title, *slot)
+                    div_slots = []
+
+            if elem.tag in KEEP_SUBTREE:
+                keep_depth -= 1
+            if keep_depth == 0 and parent is not None:
+                elem.clear()
+                parent.remove(elem)
+
+        if pending is not None:
+            emit_text(pending.text)
+        if text_parts is not None:
+            self.text = '\n'.join(text_parts)
+
+        self.metadata = {
+            "Title": _first_item(title_nodes),
+            "Publisher": _first_item(publisher_nodes),
+            "AvailabilityStatus": _first_item(status_nodes),
+            "BiblicalReference": _first_item(bibl_nodes),
+            "AppInfoDescription": _first_item(desc_nodes),
+            "Abstract": replace_symbols_with_numbers(" ".join(abstract_texts), '□'),
+        }
+        return self
+
+    def _add_row(self, current_title, has_head, head_text, paragraph_texts, has_paragraphs):
+        """Same Title/Subtitle/Content rules as ContentPDFClass.parse_xml_and_replace_symbols."""
+        head_text = head_text if has_head else 'No Title'
+        if has_head and not has_paragraphs:
+            return head_text if head_text != 'LEARNING OUTCOMES' else current_title
+        if has_paragraphs:
+            subtitle = head_text if head_text != 'No Title' else 'No Subtitle'
+            content = replace_symbols_with_numbers(" ".join(paragraph_texts), '□')
+            current_title = remove_special_characters(current_title or 'Not Available')
+            self.rows.append([current_title, subtitle, content])
+        return current_title
+
+
+def benchmark(xml_paths, repeat=5):
+    """Compare the single-pass extractor with the three-parse path (TXT, content, metadata)."""
+    from grobid_csv import ContentPDFClass, MetadataPDFClass
+
+    def three_pass(path):
+        root = ElementTree.parse(path).getroot()
+        text = '\n'.join(elem.text for elem in root.iter() if elem.text)
+        content = ContentPDFClass(path)
+        content.parse_xml_and_replace_symbols()
+        metadata = MetadataPDFClass(path).extract_metadata()
+        return text, content.data, metadata
+
+    def single_pass(path):
+        extractor = TEIExtractor(path).extract()
+        return extractor.text, extractor.rows, extractor.metadata
+
+    for path in xml_paths:
+        if three_pass(path) != single_pass(path):
+            print(f"WARNING: outputs differ for {path}")
+        timings = {}
+        for name, func in (('three-pass', three_pass), ('single-pass', single_pass)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func(path)
+            timings[name] = (time.perf_counter() - start) / repeat
+        print(f"{os.path.basename(path)}: three-pass {timings['three-pass'] * 1000:.1f} ms, "
+              f"single-pass {timings['single-pass'] * 1000:.1f} ms "
+              f"({timings['three-pass'] / timings['single-pass']:.1f}x)")
+
+
+if __name__ == "__main__":
+    # Usage: python tei_extractor.py Grobid/xml/*.xml
+    benchmark(sys.argv[1:] or [os.path.join('Grobid/xml', f) for f in sorted(os.listdir('Grobid/xml'))])
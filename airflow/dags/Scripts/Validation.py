@@ -1,10 +1,42 @@
-from pydantic import BaseModel, HttpUrl, Field, ValidationError, validator, ValidationInfo
-from pydantic.functional_validators import field_validator
+from pydantic import BaseModel, HttpUrl, Field, ValidationError, validator, ValidationInfo, TypeAdapter
+from pydantic.functional_validators import field_validator, WrapValidator
 from pathlib import Path
 import re
 import csv
 from typing import List, Optional
+from typing_extensions import Annotated
 import os  # For directory operations
+import io
+import json
+import mmap
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Processes used to validate one large CSV in parallel (parallel_validate_csv)
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", str(os.cpu_count() or 1)))
+# Target size of the byte range handed to each task
+VALIDATION_CHUNK_BYTES = int(os.getenv("VALIDATION_CHUNK_BYTES", str(4 * 1024 * 1024)))
+
+
+def validate_records(model, records):
+    """Validate already-parsed rows (dicts) against a model without any CSV round-trip.
+
+    Returns (valid models, errors) in the same format as the CSV validators.
+    """
+    valid_rows = []
+    errors = []
+    for row in records:
+        try:
+            valid_rows.append(model.model_validate(row))
+        except ValidationError as e:
+            errors.append({'row': row, 'error': str(e), 'fields': _error_fields(e)})
+    return valid_rows, errors
+
+
+def _error_fields(error):
+    """Names of the fields a ValidationError complains about, for the summary counters."""
+    return sorted({str(detail['loc'][0]) if detail['loc'] else '__root__' for detail in error.errors()})
 
 
 class Content(BaseModel):
@@ -32,7 +64,7 @@ class Content(BaseModel):
 
     @field_validator('Content')  
     def check_content_special_characters(cls, value):
-        if any(char in set('□') for char in value):
+        if '□' in value:
             raise ValueError("Content must not contain special characters")
         return value
 
@@ -42,17 +74,11 @@ class ContentValidator:
         self.csv_file_path = csv_file_path
         self.output_file_name = output_file_path  
     
-    def clean_and_validate_content_csv(self) -> List[Content]:
-        valid_rows = []
-        errors = []
+    def clean_and_validate_content_csv(self, batch: bool = False) -> List[Content]:
+        """Legacy: holds the whole file in memory and writes no quarantine file; use stream_validate_content_csv."""
         with open(self.csv_file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
-            for row in reader:
-                try:
-                    content = Content.parse_obj(row)
-                    valid_rows.append(content)
-                except ValidationError as e:
-                    errors.append({'row': row, 'error': str(e)})
+            valid_rows, errors = validate_batch(Content, reader) if batch else validate_records(Content, reader)
         
         # Ensure the output directory exists
         #os.makedirs(self.output_file_name, exist_ok=True)
@@ -60,15 +86,24 @@ class ContentValidator:
         # Define the full path for the cleaned CSV file
         cleaned_csv_path = self.output_file_name
         
-        # Write the valid rows to the cleaned CSV, overwriting any existing file
-        with open(cleaned_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        # Write the valid rows to a temporary file that then replaces the cleaned CSV
+        with open(cleaned_csv_path + '.tmp', 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=Content.__fields__.keys())
             writer.writeheader()
             for content in valid_rows:
                 writer.writerow(content.dict())
+        os.replace(cleaned_csv_path + '.tmp', cleaned_csv_path)
         
         return valid_rows, errors
 
+    def stream_validate_content_csv(self, quarantine_path: Optional[str] = None) -> dict:
+        """Constant-memory variant: see stream_validate_csv."""
+        return stream_validate_csv(Content, self.csv_file_path, self.output_file_name, quarantine_path)
+
+    def parallel_validate_content_csv(self, workers: int = VALIDATION_WORKERS, quarantine_path: Optional[str] = None) -> dict:
+        """Multi-core variant for large content CSVs: see parallel_validate_csv."""
+        return parallel_validate_csv(Content, self.csv_file_path, self.output_file_name, quarantine_path, workers)
+
 class Metadata(BaseModel):
     Title: str
     Publisher: str
@@ -99,7 +134,7 @@ class Metadata(BaseModel):
 
     @field_validator('Abstract')  
     def check_content_special_characters(cls, value):
-        if any(char in set('□') for char in value):
+        if '□' in value:
             raise ValueError("Abstract must not contain special characters")
         return value 
 
@@ -108,17 +143,11 @@ class MetadataValidator:
         self.csv_file_path = csv_file_path
         self.output_file_name = output_file_path  
     
-    def clean_and_validate_metadata_csv(self) -> List[Metadata]:
-        valid_rows = []
-        errors = []
+    def clean_and_validate_metadata_csv(self, batch: bool = False) -> List[Metadata]:
+        """Legacy: holds the whole file in memory and writes no quarantine file; use stream_validate_metadata_csv."""
         with open(self.csv_file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
-            for row in reader:
-                try:
-                    metadata = Metadata.parse_obj(row)
-                    valid_rows.append(metadata)
-                except ValidationError as e:
-                    errors.append({'row': row, 'error': str(e)})
+            valid_rows, errors = validate_batch(Metadata, reader) if batch else validate_records(Metadata, reader)
         
         # Ensure the output directory exists
         #os.makedirs(self.output_file_name, exist_ok=True)
@@ -126,15 +155,229 @@ class MetadataValidator:
         # Define the full path for the cleaned CSV file
         cleaned_csv_path = self.output_file_name
         
-        # Write the valid rows to the cleaned CSV, overwriting any existing file
-        with open(cleaned_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        # Write the valid rows to a temporary file that then replaces the cleaned CSV
+        with open(cleaned_csv_path + '.tmp', 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=Metadata.__fields__.keys())
             writer.writeheader()
             for metadata in valid_rows:
                 writer.writerow(metadata.dict())
+        os.replace(cleaned_csv_path + '.tmp', cleaned_csv_path)
         
         return valid_rows, errors
 
+    def stream_validate_metadata_csv(self, quarantine_path: Optional[str] = None) -> dict:
+        """Constant-memory variant: see stream_validate_csv."""
+        return stream_validate_csv(Metadata, self.csv_file_path, self.output_file_name, quarantine_path)
+
+
+# Batch validation: a whole chunk of rows is validated by one TypeAdapter call
+
+BATCH_SIZE = 1000
+_batch_adapters = {}
+
+def _capture_row_error(value, handler):
+    # Return a rejected row's error instead of failing the whole chunk
+    try:
+        return handler(value)
+    except ValidationError as e:
+        return e
+
+def _batch_adapter(model):
+    if model not in _batch_adapters:
+        _batch_adapters[model] = TypeAdapter(List[Annotated[model, WrapValidator(_capture_row_error)]])
+    return _batch_adapters[model]
+
+def iter_validate_batch(model, records, batch_size=BATCH_SIZE):
+    """Yield (valid models, errors) per chunk of `batch_size` rows, with one pydantic List[model] validation per chunk.
+
+    Every row runs the same validators as validate_records and a rejected row reports
+    exactly the same error text, but a chunk costs one call into pydantic-core instead
+    of one model_validate per row.
+    """
+    adapter = _batch_adapter(model)
+    title = model.model_config.get('title') or model.__name__
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            return
+        valid_rows = []
+        errors = []
+        for row, result in zip(chunk, adapter.validate_python(chunk)):
+            if not isinstance(result, ValidationError):
+                valid_rows.append(result)
+                continue
+            # Re-title the error as the model's own, as model_validate(row) reports it
+            line_errors = [
+                {key: detail[key] for key in ('type', 'loc', 'input', 'ctx') if key in detail}
+                for detail in result.errors()
+            ]
+            error = ValidationError.from_exception_data(title, line_errors)
+            errors.append({'row': row, 'error': str(error), 'fields': _error_fields(error)})
+        yield valid_rows, errors
+
+def validate_batch(model, records, batch_size=BATCH_SIZE):
+    """Validate rows in chunks (see iter_validate_batch). Returns (valid models, errors) in row order."""
+    valid_rows = []
+    errors = []
+    for chunk_valid, chunk_errors in iter_validate_batch(model, records, batch_size):
+        valid_rows.extend(chunk_valid)
+        errors.extend(chunk_errors)
+    return valid_rows, errors
+
+
+# Streaming validation: constant memory, atomic output and a dead-letter file for rejected rows
+
+def quarantine_path_for(output_file_path):
+    """<kind>/<format>/<name>.<ext> -> <kind>/quarantine/<name>.jsonl
+
+    e.g. parsed_into_schema/content/csv/<name>.csv -> parsed_into_schema/content/quarantine/<name>.jsonl
+    """
+    output_dir, output_name = os.path.split(str(output_file_path))
+    return os.path.join(os.path.dirname(output_dir), 'quarantine', os.path.splitext(output_name)[0] + '.jsonl')
+
+def write_quarantine(errors, quarantine_file):
+    """Append rejected rows and their errors to an open JSONL file, one object per line."""
+    for error in errors:
+        quarantine_file.write(json.dumps(error, ensure_ascii=False) + '\n')
+
+def new_summary():
+    return {'rows': 0, 'valid': 0, 'rejected': 0, 'fields': Counter()}
+
+def add_to_summary(summary, valid_rows, errors):
+    summary['rows'] += len(valid_rows) + len(errors)
+    summary['valid'] += len(valid_rows)
+    summary['rejected'] += len(errors)
+    for error in errors:
+        summary['fields'].update(error.get('fields', []))
+    return summary
+
+def _write_validated(chunks, fieldnames, output_file_path, quarantine_path):
+    """Write (valid row dicts, errors) chunks, in order, to temp files renamed into place at the end."""
+    tmp_output_path = str(output_file_path) + '.tmp'
+    tmp_quarantine_path = quarantine_path + '.tmp'
+    summary = new_summary()
+    os.makedirs(os.path.dirname(quarantine_path) or '.', exist_ok=True)
+    try:
+        with open(tmp_output_path, 'w', newline='', encoding='utf-8') as outfile, \
+                open(tmp_quarantine_path, 'w', encoding='utf-8') as quarantine_file:
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+            writer.writeheader()
+            for valid_rows, errors in chunks:
+                writer.writerows(valid_rows)
+                write_quarantine(errors, quarantine_file)
+                add_to_summary(summary, valid_rows, errors)
+        os.replace(tmp_output_path, output_file_path)
+        os.replace(tmp_quarantine_path, quarantine_path)
+    finally:
+        for tmp_path in (tmp_output_path, tmp_quarantine_path):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    summary['quarantine'] = quarantine_path
+    return summary
+
+def _iter_validated_csv(model, csv_file_path, batch_size):
+    with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
+        for valid_rows, errors in iter_validate_batch(model, csv.DictReader(csvfile), batch_size):
+            yield [row.model_dump() for row in valid_rows], errors
+
+def stream_validate_csv(model, csv_file_path, output_file_path, quarantine_path=None, batch_size=BATCH_SIZE):
+    """Validate a CSV chunk by chunk, holding at most `batch_size` rows in memory.
+
+    Valid rows go to a temporary file that replaces `output_file_path` only once the
+    whole input has been read, so the output may safely be the input file itself and a
+    crash never leaves a truncated CSV behind. Rejected rows stream, with their errors,
+    to a JSONL quarantine file. Returns summary counters (see new_summary).
+    """
+    quarantine_path = quarantine_path or quarantine_path_for(output_file_path)
+    chunks = _iter_validated_csv(model, csv_file_path, batch_size)
+    return _write_validated(chunks, list(model.model_fields.keys()), output_file_path, quarantine_path)
+
+
+# Parallel validation: byte-range chunks of one large CSV validated on a process pool
+
+def csv_byte_ranges(csv_file_path, chunk_bytes=VALIDATION_CHUNK_BYTES):
+    """Split a CSV into (start, end) byte ranges of about `chunk_bytes` that start and end on record boundaries.
+
+    A newline only ends a record when it is outside a quoted field, i.e. when the number
+    of quote characters before it is even ("" escapes keep the count even), so quoted
+    multi-line Content values are never cut. The first range starts after the header.
+    Returns (header end offset, ranges); (None, []) for a file without a complete header.
+    """
+    size = os.path.getsize(csv_file_path)
+    if size == 0:
+        return None, []
+    with open(csv_file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        boundaries = []
+        quotes = 0
+        scanned = 0
+        target = 0
+        while target < size:
+            newline = data.find(b'\n', target)
+            if newline < 0:
+                break
+            quotes += data[scanned:newline].count(b'"')
+            scanned = newline
+            if quotes % 2 == 0:
+                boundaries.append(newline + 1)
+                target = newline + 1 + chunk_bytes
+            else:
+                target = newline + 1
+    if not boundaries:
+        return None, []
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return boundaries[0], list(zip(boundaries, boundaries[1:]))
+
+def _validate_byte_range(model, csv_file_path, fieldnames, start, end, batch_size):
+    """Worker: validate the records in one byte range. Returns (valid row dicts, errors) in row order."""
+    with open(csv_file_path, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+    reader = csv.DictReader(io.StringIO(text, newline=''), fieldnames=fieldnames)
+    valid_rows, errors = validate_batch(model, reader, batch_size)
+    return [row.model_dump() for row in valid_rows], errors
+
+def parallel_validate_csv(model, csv_file_path, output_file_path, quarantine_path=None,
+                          workers=VALIDATION_WORKERS, chunk_bytes=VALIDATION_CHUNK_BYTES, batch_size=BATCH_SIZE):
+    """stream_validate_csv spread over `workers` processes; the output is byte-identical.
+
+    The input is split into record-aligned byte ranges (csv_byte_ranges) that are validated
+    on a process pool. Results are written strictly in range order, and only a couple of
+    ranges per worker are in flight, so memory stays bounded by workers * chunk_bytes.
+    Small files and workers <= 1 use the serial path.
+    """
+    quarantine_path = quarantine_path or quarantine_path_for(output_file_path)
+    header_end, ranges = csv_byte_ranges(csv_file_path, chunk_bytes)
+    if workers <= 1 or len(ranges) <= 1:
+        return stream_validate_csv(model, csv_file_path, output_file_path, quarantine_path, batch_size)
+
+    with open(csv_file_path, 'rb') as file:
+        header = file.read(header_end).decode('utf-8')
+    fieldnames = next(csv.reader(io.StringIO(header, newline='')))
+
+    def chunks(executor):
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(_validate_byte_range, model, csv_file_path, fieldnames, start, end, batch_size))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return _write_validated(chunks(executor), list(model.model_fields.keys()), output_file_path, quarantine_path)
+
+def format_summary(summary):
+    """One-line summary of a validation run, e.g. 'rows: 120, valid: 117, rejected: 3 (Title: 2, Content: 1)'."""
+    line = f"rows: {summary['rows']}, valid: {summary['valid']}, rejected: {summary['rejected']}"
+    if summary['fields']:
+        line += ' (' + ', '.join(f"{field}: {count}" for field, count in summary['fields'].most_common()) + ')'
+    if summary.get('quarantine') and summary['rejected']:
+        line += f" -> {summary['quarantine']}"
+    return line
+
+
 
 
 
@@ -1,11 +1,27 @@
-from fastapi import FastAPI, HTTPException,  Request
-import requests
-from requests.auth import HTTPBasicAuth
+from fastapi import FastAPI, HTTPException,  Request, Query, Header
+from fastapi.responses import Response, StreamingResponse
+import httpx
 from pydantic import BaseModel
 from datetime import datetime
 from dotenv import load_dotenv
 from fastapi.exceptions import RequestValidationError
+from typing import List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
 import os
+import math
+import time
+import heapq
+import uuid
+import queue
+import asyncio
+import threading
+import re
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
 import snowflake.connector
 
 # Load environment variables from .env file
@@ -15,90 +31,991 @@ app = FastAPI()
 
 airflow_endpoint = os.getenv('airflowurl')
 
+# Seconds between Airflow status polls while long-polling a DAG run, and the longest wait allowed
+AIRFLOW_POLL_INTERVAL = float(os.getenv('AIRFLOW_POLL_INTERVAL', '2'))
+AIRFLOW_MAX_WAIT = float(os.getenv('AIRFLOW_MAX_WAIT', '60'))
+AIRFLOW_ACTIVE_STATES = ('queued', 'running')
+
+# One pooled async client for every Airflow call, created on first use
+_airflow_client = None
+
+def get_airflow_client():
+    global _airflow_client
+    if _airflow_client is None:
+        _airflow_client = httpx.AsyncClient(
+            base_url=f"{airflow_endpoint}/api/v1",
+            auth=(os.getenv('AIRFLOW_USERNAME'), os.getenv('AIRFLOW_PASSWORD')),
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=5),
+        )
+    return _airflow_client
+
+@app.on_event("shutdown")
+async def close_airflow_client():
+    if _airflow_client is not None:
+        await _airflow_client.aclose()
+
+async def airflow_request(method, path, **kwargs):
+    try:
+        response = await get_airflow_client().request(method, path, **kwargs)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Airflow request failed: {e}")
+    if response.status_code not in [200, 201]:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    return response.json()
+
+def new_run_id():
+    # Microseconds plus a random suffix: two clicks in the same second get different run IDs
+    return f"triggered_via_fastapi_{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:8]}"
+
+async def find_active_run(dag_id):
+    """The most recent queued or running run of a DAG, or None."""
+    runs = await airflow_request(
+        "GET", f"/dags/{dag_id}/dagRuns",
+        params=[("state", state) for state in AIRFLOW_ACTIVE_STATES] + [("order_by", "-execution_date"), ("limit", 1)],
+    )
+    dag_runs = runs.get("dag_runs", [])
+    return dag_runs[0] if dag_runs else None
+
+# Triggers for the same DAG are handled one at a time, so concurrent clicks see each other's run
+_trigger_locks = {}
+
 # Define a request model to expect certain JSON payload structure
 class TriggerDAGRequest(BaseModel):
     dag_id: str
     conf: dict = None  # Optional configuration for the DAG
+    force: bool = False  # Start a new run even if one is already queued or running
 
 # Endpoint to trigger an Airflow DAG
 @app.post("/trigger-airflow-dag")
 async def trigger_airflow_dag(request_data: TriggerDAGRequest):
-    airflow_url = f"{airflow_endpoint}/api/v1/dags/{request_data.dag_id}/dagRuns"
-    # airflow_url = f"http://localhost:8080/api/v1/dags/grobid_processing/dagRuns"
-    airflow_username = os.getenv('AIRFLOW_USERNAME')
-    airflow_password = os.getenv('AIRFLOW_PASSWORD')
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    unique_run_id = f"triggered_via_fastapi_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    payload = {
-        "dag_run_id": unique_run_id,
-        "conf": request_data.conf if request_data.conf else {},
-    }
-    
-    response = requests.post(
-        airflow_url, 
-        json=payload, 
-        headers=headers,
-        auth=HTTPBasicAuth(airflow_username, airflow_password)
-    )
-    
-    if response.status_code in [200, 201]:
-        return {"message": "DAG triggered successfully", "details": response.json()}
-    else:
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+    """Start a DAG run, or attach to the run of that DAG that is already queued or running."""
+    lock = _trigger_locks.setdefault(request_data.dag_id, asyncio.Lock())
+    async with lock:
+        if not request_data.force:
+            active_run = await find_active_run(request_data.dag_id)
+            if active_run is not None:
+                return {"message": "DAG run already in progress", "coalesced": True, "details": active_run}
+
+        payload = {
+            "dag_run_id": new_run_id(),
+            "conf": request_data.conf if request_data.conf else {},
+        }
+        dag_run = await airflow_request("POST", f"/dags/{request_data.dag_id}/dagRuns", json=payload)
+        return {"message": "DAG triggered successfully", "coalesced": False, "details": dag_run}
+
+# Long-poll a DAG run: answers as soon as its state differs from `state`, or after `timeout` seconds
+@app.get("/airflow/dags/{dag_id}/dagRuns/{dag_run_id}/wait")
+async def wait_for_dag_run(dag_id: str, dag_run_id: str, state: Optional[str] = None,
+                           timeout: float = Query(30.0, ge=0)):
+    """Return the DAG run once its state is not `state` (the client's last known state).
+
+    Without `state` this returns as soon as the run is no longer queued or running.
+    `changed` tells whether the wait ended on a state change or on the timeout.
+    """
+    deadline = time.monotonic() + min(timeout, AIRFLOW_MAX_WAIT)
+    while True:
+        dag_run = await airflow_request("GET", f"/dags/{dag_id}/dagRuns/{dag_run_id}")
+        current = dag_run.get("state")
+        changed = current != state if state is not None else current not in AIRFLOW_ACTIVE_STATES
+        remaining = deadline - time.monotonic()
+        if changed or remaining <= 0:
+            return {"changed": changed, "state": current, "details": dag_run}
+        await asyncio.sleep(min(AIRFLOW_POLL_INTERVAL, remaining))
 
 
 ## Endpoints for Snowflake
 
-# Initialize Snowflake connection
-snowflake_ctx = snowflake.connector.connect(
-user=os.getenv('SNOWFLAKE_USER'),
-password=os.getenv('SNOWFLAKE_PASSWORD'),
-account=os.getenv('SNOWFLAKE_ACCOUNT'),
-warehouse = os.getenv('SNOWFLAKE_WAREHOUSE'),
-database = os.getenv('SNOWFLAKE_DATABASE'),
-schema = os.getenv('SNOWFLAKE_SCHEMA')
-)
+# Connections kept open to Snowflake, and threads running their blocking calls
+SNOWFLAKE_POOL_SIZE = int(os.getenv('SNOWFLAKE_POOL_SIZE', '4'))
+# Seconds a request may spend on Snowflake work (also set as the session's statement timeout)
+SNOWFLAKE_QUERY_TIMEOUT = int(os.getenv('SNOWFLAKE_QUERY_TIMEOUT', '60'))
+# Seconds to wait for a free connection before answering 503
+SNOWFLAKE_POOL_TIMEOUT = float(os.getenv('SNOWFLAKE_POOL_TIMEOUT', '10'))
+# A connection idle for longer than this is checked with SELECT 1 before it is handed out
+SNOWFLAKE_HEALTH_CHECK_SECONDS = float(os.getenv('SNOWFLAKE_HEALTH_CHECK_SECONDS', '300'))
+
+def connect_snowflake():
+    return snowflake.connector.connect(
+        user=os.getenv('SNOWFLAKE_USER'),
+        password=os.getenv('SNOWFLAKE_PASSWORD'),
+        account=os.getenv('SNOWFLAKE_ACCOUNT'),
+        warehouse = os.getenv('SNOWFLAKE_WAREHOUSE'),
+        database = os.getenv('SNOWFLAKE_DATABASE'),
+        schema = os.getenv('SNOWFLAKE_SCHEMA'),
+        session_parameters={'STATEMENT_TIMEOUT_IN_SECONDS': SNOWFLAKE_QUERY_TIMEOUT},
+    )
+
+class SnowflakePool:
+    """Fixed-size pool of Snowflake connections, opened on demand.
+
+    Connections that have been idle for a while are health checked before they are
+    handed out, and closed or failing ones are replaced by new connections.
+    """
+
+    def __init__(self, size, connect, health_check_seconds):
+        self.size = size
+        self.connect = connect
+        self.health_check_seconds = health_check_seconds
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.recycled = 0
+        # Threads blocked in acquire(), woken when a discarded connection frees capacity
+        self.waiters = 0
+
+    def _healthy(self, conn, idle_since):
+        if conn.is_closed():
+            return False
+        if time.monotonic() - idle_since < self.health_check_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except snowflake.connector.errors.Error:
+            return False
+
+    def _free_slot(self):
+        """Give back the capacity of a connection that is gone; a blocked acquire() gets a wake-up token."""
+        with self.lock:
+            self.opened -= 1
+            wake = self.waiters > 0
+        if wake:
+            self.idle.put((None, 0))
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.lock:
+            self.recycled += 1
+        self._free_slot()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                conn, idle_since = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    can_open = self.opened < self.size
+                    if can_open:
+                        self.opened += 1
+                if can_open:
+                    try:
+                        return self.connect()
+                    except Exception:
+                        self._free_slot()
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise HTTPException(status_code=503, detail="No Snowflake connection available")
+                with self.lock:
+                    self.waiters += 1
+                try:
+                    conn, idle_since = self.idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                finally:
+                    with self.lock:
+                        self.waiters -= 1
+            if conn is None:
+                # Wake-up token: capacity was freed, so try to open a connection again
+                continue
+            if self._healthy(conn, idle_since):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        if conn.is_closed():
+            self._discard(conn)
+        else:
+            self.idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self, timeout=SNOWFLAKE_POOL_TIMEOUT):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        idle = sum(conn is not None for conn, _ in list(self.idle.queue))
+        return {"size": self.size, "open": self.opened, "idle": idle, "recycled": self.recycled}
+
+snowflake_pool = SnowflakePool(SNOWFLAKE_POOL_SIZE, connect_snowflake, SNOWFLAKE_HEALTH_CHECK_SECONDS)
+# Blocking connector calls run here, never on the event loop
+snowflake_executor = ThreadPoolExecutor(max_workers=SNOWFLAKE_POOL_SIZE, thread_name_prefix='snowflake')
+
+async def run_blocking(func, *args, timeout=SNOWFLAKE_QUERY_TIMEOUT):
+    """Run a blocking call on the Snowflake threads; 504 if it takes longer than `timeout` seconds."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(snowflake_executor, partial(func, *args)), timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Snowflake query timed out")
+
+async def run_query(func, *args, timeout=SNOWFLAKE_QUERY_TIMEOUT):
+    """Run func(conn, *args) with a pooled connection on the Snowflake threads."""
+    def work():
+        with snowflake_pool.connection() as conn:
+            return func(conn, *args)
+    return await run_blocking(work, timeout=timeout)
+
+async def run_query_to_completion(func, *args, timeout=SNOWFLAKE_QUERY_TIMEOUT):
+    """Like run_query, but on timeout waits for the thread to return before answering 504.
+
+    For callers holding a concurrency slot: the slot stays taken while the query still
+    occupies a connection and a thread. `func` should enforce `timeout` in Snowflake too,
+    so the wait after the 504 is short.
+    """
+    def work():
+        with snowflake_pool.connection() as conn:
+            return func(conn, *args)
+    future = asyncio.get_running_loop().run_in_executor(snowflake_executor, work)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        try:
+            await future
+        except Exception:
+            pass
+        raise HTTPException(status_code=504, detail="Snowflake query timed out")
+
+# Query-result cache: the tables only change when the pipeline loads them
+
+QUERY_CACHE_TTL_SECONDS = float(os.getenv('QUERY_CACHE_TTL_SECONDS', '900'))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', '512'))
+QUERY_CACHE_MAX_MB = float(os.getenv('QUERY_CACHE_MAX_MB', '64'))
+# When set, /snowflake/cache/invalidate requires this value in the X-Cache-Token header
+QUERY_CACHE_TOKEN = os.getenv('QUERY_CACHE_TOKEN')
+
+# Statements whose results may be cached
+CACHEABLE_SQL = re.compile(r'^\s*(SELECT|WITH|SHOW|DESC|DESCRIBE)\b', re.IGNORECASE)
+
+def normalize_sql(sql):
+    """Collapse whitespace and drop trailing semicolons, so trivially different spellings share an entry."""
+    return ' '.join(sql.split()).rstrip(';').strip()
+
+class QueryCache:
+    """LRU cache of query results keyed by normalized SQL and parameters.
+
+    Entries expire after `ttl` seconds; the least recently used ones are evicted
+    beyond `max_entries` or `max_bytes` (sizes are estimated from the JSON encoding).
+    invalidate() drops everything, or only the entries whose SQL mentions a table.
+    """
+
+    def __init__(self, ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires, size, sql, value)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(sql, params=()):
+        return normalize_sql(sql), tuple(params or ())
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[3]
+
+    @classmethod
+    def size_of(cls, value):
+        if isinstance(value, pa.Table):
+            return value.nbytes
+        if isinstance(value, tuple) and any(isinstance(item, pa.Table) for item in value):
+            return sum(cls.size_of(item) for item in value)
+        return len(json.dumps(value, default=str))
+
+    def put(self, key, value):
+        size = self.size_of(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl, size, key[0], value)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry[1]
+
+    def invalidate(self, tables=None):
+        """Drop all entries, or those whose SQL mentions one of `tables` (plus table listings). Returns the count."""
+        if not tables:
+            keys = list(self.entries)
+        else:
+            pattern = re.compile(r'\b(' + '|'.join(re.escape(table) for table in tables) + r')\b|^SHOW\b', re.IGNORECASE)
+            keys = [key for key, entry in self.entries.items() if pattern.search(entry[2])]
+        for key in keys:
+            self._remove(key)
+        self.invalidations += 1
+        return len(keys)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+query_cache = QueryCache(QUERY_CACHE_TTL_SECONDS, QUERY_CACHE_MAX_ENTRIES, int(QUERY_CACHE_MAX_MB * 1024 * 1024))
+
+async def cached_query(sql, params, func, *args):
+    """run_query(func, *args) through the result cache, keyed by `sql` and `params`."""
+    key = query_cache.make_key(sql, params)
+    value = query_cache.get(key)
+    if value is None:
+        value = await run_query(func, *args)
+        query_cache.put(key, value)
+    return value
+
+class InvalidateCacheRequest(BaseModel):
+    tables: Optional[List[str]] = None  # None drops every entry
+
+# Called by the load stage (snowflake_transfer.py) once new data is in Snowflake
+@app.post("/snowflake/cache/invalidate")
+async def invalidate_cache(request_data: InvalidateCacheRequest, x_cache_token: Optional[str] = Header(None)):
+    if QUERY_CACHE_TOKEN and x_cache_token != QUERY_CACHE_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid cache token")
+    return {"invalidated": query_cache.invalidate(request_data.tables)}
+
+@app.get("/snowflake/cache/stats")
+async def cache_stats():
+    return query_cache.stats()
+
+@app.get("/snowflake/health")
+async def snowflake_health():
+    def check(conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+    await run_query(check, timeout=SNOWFLAKE_POOL_TIMEOUT)
+    return {"status": "ok", "pool": snowflake_pool.stats()}
 
 # Snowflake endpoint to get tables
+def fetch_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute("SHOW TABLES;")
+        return cur.fetchall()
+
 @app.get("/snowflake/tables")
 async def get_tables():
-    with snowflake_ctx.cursor() as cur:
-        cur.execute("SHOW TABLES;")
-        tables = cur.fetchall()
-        return {"tables": [table[1] for table in tables]}  # Adjust based on actual structure
+    tables = await cached_query("SHOW TABLES", (), fetch_tables)
+    return {"tables": [table[1] for table in tables]}  # Adjust based on actual structure
 
 # Snowflake endpoint to get table data
 
-@app.get("/snowflake/table/{table_name}")
-async def get_table_data(table_name: str):
-    print(table_name)
-    with snowflake_ctx.cursor() as cur:
-        cur.execute(f"SELECT * FROM {table_name};")
-        rows = cur.fetchall()
-        print(rows)
+# Rows per page of /snowflake/table/{table_name}, and the largest page a client may ask for
+TABLE_PAGE_SIZE = int(os.getenv('TABLE_PAGE_SIZE', '1000'))
+TABLE_MAX_PAGE_SIZE = int(os.getenv('TABLE_MAX_PAGE_SIZE', '10000'))
+# Rows fetched from the cursor per batch when streaming NDJSON
+TABLE_STREAM_BATCH = int(os.getenv('TABLE_STREAM_BATCH', '1000'))
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*$')
+
+def quote_identifier(name):
+    # Table and column names come from the URL: only plain identifiers are accepted
+    if not IDENTIFIER.match(name):
+        raise HTTPException(status_code=400, detail=f"Invalid identifier: {name}")
+    return f'"{name.upper()}"'
+
+# Default cursor column: added by the pipeline's merge and bulk loads (a hash, so its order is arbitrary)
+TABLE_DEFAULT_KEY = 'ROW_HASH'
+
+def fetch_table_columns(conn, table_name):
+    with conn.cursor() as cur:
+        try:
+            cur.execute(f"SELECT * FROM {quote_identifier(table_name)} LIMIT 0")
+        except snowflake.connector.errors.ProgrammingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return [desc[0].upper() for desc in cur.description]
+
+async def table_columns(table_name):
+    sql = f"SELECT * FROM {quote_identifier(table_name)} LIMIT 0"
+    return await cached_query(sql, ['columns'], fetch_table_columns, table_name)
+
+def build_table_query(table_name, columns, key, after, limit, ordered, column_count=None, tiebreak=None):
+    """SELECT for one page (or stream) of a table: projected columns, rows after the key cursor, in key order.
+
+    With a `tiebreak` column the order is (key, tiebreak) and `after` is a cursor from
+    pair_cursor, so rows sharing a key are not skipped at a page boundary. Without a
+    key (tables loaded without ROW_HASH) the rows are ordered by every selected column
+    (`column_count` of them for *) and `after` is a row offset.
+    """
+    selected = [column.strip() for column in columns.split(',') if column.strip()] if columns else []
+    for column in [key, tiebreak] if key is not None else []:
+        if column is not None and selected and column.upper() not in (name.upper() for name in selected):
+            # The cursor columns are needed to hand out the next cursor
+            selected.append(column)
+    projection = ', '.join(quote_identifier(column) for column in selected) if selected else '*'
+    sql = f"SELECT {projection} FROM {quote_identifier(table_name)}"
+    params = []
+    if key is None:
+        if ordered:
+            positions = range(1, (len(selected) or column_count or 1) + 1)
+            sql += " ORDER BY " + ', '.join(str(position) for position in positions)
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        if after is not None:
+            sql += f" OFFSET {offset_cursor(after)}"
+        return sql, params
+    if after is not None and tiebreak is not None:
+        key_value, tiebreak_value = split_pair_cursor(after)
+        sql += f" WHERE ({quote_identifier(key)} > %s OR ({quote_identifier(key)} = %s AND {quote_identifier(tiebreak)} > %s))"
+        params.extend([key_value, key_value, tiebreak_value])
+    elif after is not None:
+        sql += f" WHERE {quote_identifier(key)} > %s"
+        params.append(after)
+    if ordered:
+        sql += f" ORDER BY {quote_identifier(key)}"
+        if tiebreak is not None:
+            sql += f", {quote_identifier(tiebreak)}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+def offset_cursor(after):
+    if not after.isdigit():
+        raise HTTPException(status_code=400, detail="This table has no key column: the cursor is a row offset")
+    return int(after)
+
+def pair_cursor(key_value, tiebreak_value):
+    return json.dumps([key_value, tiebreak_value], default=str)
+
+def split_pair_cursor(after):
+    try:
+        pair = json.loads(after)
+    except ValueError:
+        pair = None
+    if not isinstance(pair, list) or len(pair) != 2:
+        raise HTTPException(status_code=400, detail="With key= the cursor is the [key, ROW_HASH] pair handed out in `next`")
+    return pair
+
+def next_cursor_for(key, after, limit, page_columns, last_row, row_count, tiebreak=None):
+    """Cursor of the page after this one, or None on the last page."""
+    if row_count < limit:
+        return None
+    if key is None:
+        return str((offset_cursor(after) if after is not None else 0) + row_count)
+    names = [column.upper() for column in page_columns]
+    if tiebreak is not None:
+        return pair_cursor(last_row[names.index(key.upper())], last_row[names.index(tiebreak.upper())])
+    return last_row[names.index(key.upper())]
+
+async def stream_ndjson(conn, cur):
+    """Yield one JSON object per row of an executed cursor, fetching in batches as the client reads.
+
+    The connection stays checked out until the stream ends, then goes back to the pool.
+    If the client goes away mid-fetch, that happens only once the fetch has returned.
+    """
+    loop = asyncio.get_running_loop()
+    pending = None
+    try:
         columns = [desc[0] for desc in cur.description]
-        return {"columns": columns, "rows": rows}
+        while True:
+            pending = loop.run_in_executor(snowflake_executor, cur.fetchmany, TABLE_STREAM_BATCH)
+            try:
+                # Shielded, so a cancelled stream leaves `pending` running rather than marking it done
+                rows = await asyncio.wait_for(asyncio.shield(pending), SNOWFLAKE_QUERY_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail="Snowflake query timed out")
+            pending = None
+            if not rows:
+                break
+            yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows)
+    finally:
+        if pending is not None and not pending.done():
+            # The fetch is still using the connection: release it once the thread returns
+            pending.add_done_callback(lambda done: close_stream_cursor(conn, cur))
+        else:
+            close_stream_cursor(conn, cur)
+
+def close_stream_cursor(conn, cur):
+    cur.close()
+    snowflake_pool.release(conn)
+
+def open_stream_cursor(sql, params):
+    conn = snowflake_pool.acquire(SNOWFLAKE_POOL_TIMEOUT)
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+    except snowflake.connector.errors.ProgrammingError as e:
+        close_stream_cursor(conn, cur)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        close_stream_cursor(conn, cur)
+        raise
+    return conn, cur
+
+async def start_stream(sql, params, timeout=SNOWFLAKE_QUERY_TIMEOUT):
+    """Execute the query for a stream on the Snowflake threads and return (conn, cur) checked out."""
+    future = asyncio.get_running_loop().run_in_executor(snowflake_executor, open_stream_cursor, sql, params)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        # The query is still running: hand its connection back to the pool once it finishes
+        future.add_done_callback(
+            lambda done: done.cancelled() or done.exception() or close_stream_cursor(*done.result())
+        )
+        raise HTTPException(status_code=504, detail="Snowflake query timed out")
+
+def fetch_page(conn, sql, params):
+    with conn.cursor() as cur:
+        try:
+            cur.execute(sql, params)
+        except snowflake.connector.errors.ProgrammingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return cur.fetchall(), [desc[0] for desc in cur.description]
+
+# Columnar responses: Arrow IPC stream or Parquet, chosen by Accept header or ?format=
+
+ARROW_STREAM_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+PARQUET_MEDIA_TYPE = 'application/vnd.apache.parquet'
+FORMAT_PATTERN = '^(json|ndjson|arrow|parquet)$'
+
+def negotiate_format(request, format):
+    """An explicit ?format= wins; otherwise the Accept header picks arrow or parquet, defaulting to json."""
+    if format:
+        return format
+    accept = request.headers.get('accept', '')
+    if ARROW_STREAM_MEDIA_TYPE in accept:
+        return 'arrow'
+    if PARQUET_MEDIA_TYPE in accept or 'application/x-parquet' in accept:
+        return 'parquet'
+    return 'json'
+
+def rows_to_arrow(rows, columns):
+    """Arrow table from cursor rows, for results the connector cannot hand over as Arrow (e.g. SHOW)."""
+    arrays = []
+    for i in range(len(columns)):
+        values = [row[i] for row in rows]
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if value is None else str(value) for value in values], type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=columns)
+
+def fetch_arrow(conn, sql, params=None, timeout=None):
+    """Execute a query and return its result as an Arrow table, built from the cursor's Arrow batches."""
+    with conn.cursor() as cur:
+        try:
+            cur.execute(sql, params, timeout=timeout)
+        except snowflake.connector.errors.ProgrammingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        columns = [desc[0] for desc in cur.description] if cur.description else []
+        table = None
+        if hasattr(cur, 'fetch_arrow_all'):
+            try:
+                table = cur.fetch_arrow_all()
+            except snowflake.connector.errors.NotSupportedError:
+                # Not an Arrow result set (SHOW, DESCRIBE, ...): fall back to the rows
+                pass
+            else:
+                # None means an empty result
+                return table if table is not None else rows_to_arrow([], columns)
+        return rows_to_arrow(cur.fetchall(), columns)
+
+def serialize_arrow(table, format):
+    sink = pa.BufferOutputStream()
+    if format == 'parquet':
+        pq.write_table(table, sink, compression='zstd')
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+async def arrow_response(table, format, headers=None):
+    content = await run_blocking(serialize_arrow, table, format)
+    media_type = PARQUET_MEDIA_TYPE if format == 'parquet' else ARROW_STREAM_MEDIA_TYPE
+    return Response(content=content, media_type=media_type, headers=headers)
+
+@app.get("/snowflake/table/{table_name}")
+async def get_table_data(
+    request: Request,
+    table_name: str,
+    limit: Optional[int] = Query(None, ge=1, le=TABLE_MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    columns: Optional[str] = None,
+    key: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern=FORMAT_PATTERN),
+):
+    """One page of a table in `key` order, starting after the `after` cursor.
+
+    `key` defaults to ROW_HASH when the table has it. That is a hash, so pages follow no
+    meaningful (e.g. document) order; pass key= for one. Such a key need not be unique:
+    ROW_HASH breaks ties and the cursor is a [key, ROW_HASH] pair. On a table without
+    ROW_HASH a key= column must be unique, as rows sharing the last key of a page would
+    be skipped. A table without ROW_HASH and no `key` is paged by offset, ordered by all
+    of its columns.
+    The response carries `next`, the cursor of the following page (null on the last
+    page). `columns` is a comma-separated projection. With format=ndjson the rows are
+    streamed as they are fetched instead, one JSON object per line; without
+    `limit`/`after` that is the whole table, in no particular order.
+    With format=arrow/parquet (or the matching Accept header) the page is returned as an
+    Arrow IPC stream or a Parquet file, and the next cursor in the X-Next-Cursor header.
+    """
+    format = negotiate_format(request, format)
+    column_count = None
+    tiebreak = None
+    table_column_names = await table_columns(table_name)
+    if key is None:
+        if TABLE_DEFAULT_KEY in table_column_names:
+            key = TABLE_DEFAULT_KEY
+        else:
+            column_count = len(table_column_names)
+    elif key.upper() != TABLE_DEFAULT_KEY and TABLE_DEFAULT_KEY in table_column_names:
+        tiebreak = TABLE_DEFAULT_KEY
+
+    if format == 'ndjson':
+        ordered = limit is not None or after is not None
+        sql, params = build_table_query(table_name, columns, key, after, limit, ordered, column_count, tiebreak)
+        conn, cur = await start_stream(sql, params)
+        return StreamingResponse(stream_ndjson(conn, cur), media_type='application/x-ndjson')
+
+    limit = limit or TABLE_PAGE_SIZE
+    sql, params = build_table_query(table_name, columns, key, after, limit, True, column_count, tiebreak)
+    if format in ('arrow', 'parquet'):
+        table = await cached_query(sql, [*params, 'arrow'], fetch_arrow, sql, params)
+        headers = {}
+        last_row = [column[-1].as_py() for column in table.columns] if table.num_rows else None
+        next_cursor = next_cursor_for(key, after, limit, table.column_names, last_row, table.num_rows, tiebreak)
+        if next_cursor is not None:
+            headers['X-Next-Cursor'] = str(next_cursor)
+        return await arrow_response(table, format, headers)
+
+    rows, columns = await cached_query(sql, params, fetch_page, sql, params)
+    next_cursor = next_cursor_for(key, after, limit, columns, rows[-1] if rows else None, len(rows), tiebreak)
+    return {"columns": columns, "rows": rows, "next": next_cursor}
 
 # endpoint to execute SQL queries on Snowflake
+
+# Admission control for /snowflake/execute, which runs LLM-generated SQL
+EXECUTE_MAX_CONCURRENT = int(os.getenv('EXECUTE_MAX_CONCURRENT', str(SNOWFLAKE_POOL_SIZE)))
+# Queries one client may run at once, and how many more of its queries may wait for a slot
+EXECUTE_CLIENT_SLOTS = int(os.getenv('EXECUTE_CLIENT_SLOTS', '1'))
+EXECUTE_CLIENT_QUEUE = int(os.getenv('EXECUTE_CLIENT_QUEUE', '4'))
+EXECUTE_QUEUE_TIMEOUT = float(os.getenv('EXECUTE_QUEUE_TIMEOUT', '30'))
+EXECUTE_TIMEOUT = int(os.getenv('EXECUTE_TIMEOUT', '30'))
+# Rows returned at most; a LIMIT is added or lowered so Snowflake stops early too
+EXECUTE_MAX_ROWS = int(os.getenv('EXECUTE_MAX_ROWS', '10000'))
+# EXPLAIN pre-check: above the downgrade threshold the row cap drops, above the maximum the query is rejected
+EXECUTE_DOWNGRADE_BYTES = int(os.getenv('EXECUTE_DOWNGRADE_BYTES', str(1024 ** 3)))
+EXECUTE_MAX_BYTES = int(os.getenv('EXECUTE_MAX_BYTES', str(10 * 1024 ** 3)))
+EXECUTE_DOWNGRADED_ROWS = int(os.getenv('EXECUTE_DOWNGRADED_ROWS', '100'))
+
+TRAILING_LIMIT = re.compile(r'\bLIMIT\s+(\d+)(\s+OFFSET\s+\d+)?\s*$', re.IGNORECASE)
+
+class AdmissionController:
+    """Concurrency slots for /snowflake/execute: a global limit, per-client slots and a bounded per-client queue.
+
+    A client whose queue is full, or that waits longer than `queue_timeout`, is turned
+    away with 429. Counters for admitted, queued, rejected and timed-out queries are kept
+    in `metrics`. A client's entries are dropped once it has no query running or waiting,
+    so client ids chosen by callers do not pile up.
+    """
+
+    def __init__(self, max_concurrent, client_slots, client_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.client_slots = client_slots
+        self.client_queue = client_queue
+        self.queue_timeout = queue_timeout
+        # Semaphores are created on first use, inside the server's event loop
+        self.global_semaphore = None
+        self.client_semaphores = {}
+        self.waiting = {}
+        # Queries per client that are running or waiting
+        self.in_flight = {}
+        self.running = 0
+        self.metrics = {"admitted": 0, "queued": 0, "rejected": {}, "timed_out": 0, "truncated": 0, "downgraded": 0}
+
+    def reject(self, reason, status_code, detail):
+        self.metrics["rejected"][reason] = self.metrics["rejected"].get(reason, 0) + 1
+        raise HTTPException(status_code=status_code, detail=detail)
+
+    async def _acquire(self, client_semaphore):
+        await client_semaphore.acquire()
+        try:
+            await self.global_semaphore.acquire()
+        except BaseException:
+            client_semaphore.release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, client_id):
+        if self.global_semaphore is None:
+            self.global_semaphore = asyncio.Semaphore(self.max_concurrent)
+        client_semaphore = self.client_semaphores.setdefault(client_id, asyncio.Semaphore(self.client_slots))
+        self.in_flight[client_id] = self.in_flight.get(client_id, 0) + 1
+        try:
+            if not client_semaphore.locked() and not self.global_semaphore.locked():
+                # Both slots are free: taken right away, without the task wait_for would start,
+                # so a burst is counted against the queue as it arrives
+                await self._acquire(client_semaphore)
+            else:
+                if self.waiting.get(client_id, 0) >= self.client_queue:
+                    self.reject("queue_full", 429, "Too many queries queued for this client")
+                self.metrics["queued"] += 1
+                self.waiting[client_id] = self.waiting.get(client_id, 0) + 1
+                try:
+                    await asyncio.wait_for(self._acquire(client_semaphore), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.reject("queue_timeout", 429, "Timed out waiting for a query slot")
+                finally:
+                    self.waiting[client_id] -= 1
+            self.metrics["admitted"] += 1
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+                self.global_semaphore.release()
+                client_semaphore.release()
+        finally:
+            self.in_flight[client_id] -= 1
+            if not self.in_flight[client_id]:
+                del self.in_flight[client_id]
+                del self.client_semaphores[client_id]
+                self.waiting.pop(client_id, None)
+
+    def stats(self):
+        return {**self.metrics, "running": self.running, "waiting": sum(self.waiting.values()),
+                "clients": len(self.in_flight)}
+
+admission = AdmissionController(EXECUTE_MAX_CONCURRENT, EXECUTE_CLIENT_SLOTS, EXECUTE_CLIENT_QUEUE, EXECUTE_QUEUE_TIMEOUT)
+
+def check_statement(sql_query):
+    """Only single read-only statements are accepted. Returns the normalized text, for the checks and the cache key."""
+    statement = normalize_sql(sql_query or '')
+    if not statement or not CACHEABLE_SQL.match(statement) or ';' in statement:
+        admission.reject("not_read_only", 400, "Only single SELECT/WITH/SHOW/DESCRIBE statements are allowed")
+    return statement
+
+def apply_row_cap(statement, row_cap):
+    """Make a SELECT/WITH return at most row_cap + 1 rows (one extra to detect truncation).
+
+    An added LIMIT goes on a line of its own, so a trailing -- comment cannot swallow it.
+    """
+    if not re.match(r'^(SELECT|WITH)\b', statement, re.IGNORECASE):
+        return statement
+    limit = TRAILING_LIMIT.search(statement)
+    if limit is None:
+        return f"{statement}\nLIMIT {row_cap + 1}"
+    if int(limit.group(1)) > row_cap + 1:
+        return statement[:limit.start(1)] + str(row_cap + 1) + statement[limit.end(1):]
+    return statement
+
+def explain_cost(conn, statement):
+    """Bytes the query would scan and whether it has a cartesian join, from EXPLAIN USING JSON (None if unknown)."""
+    with conn.cursor() as cur:
+        try:
+            cur.execute(f"EXPLAIN USING JSON {statement}", timeout=EXECUTE_TIMEOUT)
+        except snowflake.connector.errors.ProgrammingError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        row = cur.fetchone()
+    try:
+        plan = json.loads(row[0])
+    except (TypeError, ValueError, IndexError):
+        return None
+    operations = [operation.get('operation') for group in plan.get('Operations', []) for operation in group]
+    return {
+        "bytes": plan.get('GlobalStats', {}).get('bytesAssigned', 0),
+        "cartesian_join": 'CartesianJoin' in operations,
+    }
+
+def fetch_results(conn, sql_query, timeout=None):
+    with conn.cursor() as cur:
+        cur.execute(sql_query, timeout=timeout)
+        rows = cur.fetchall()
+        columns = [desc[0] for desc in cur.description] if cur.description else []
+        return rows, columns
+
+@app.get("/snowflake/execute/metrics")
+async def execute_metrics():
+    return admission.stats()
+
 @app.post("/snowflake/execute")
-async def execute_query(request: Request):
+async def execute_query(request: Request, format: Optional[str] = Query(None, pattern='^(json|arrow|parquet)$')):
+    """Run a read-only query under admission control.
+
+    The query waits for one of the client's slots (X-Client-Id header, e.g. Streamlit's
+    per-session id, else the client address), is checked with EXPLAIN (cartesian joins and scans above EXECUTE_MAX_BYTES
+    are rejected, scans above EXECUTE_DOWNGRADE_BYTES get a smaller row cap), and runs
+    with a statement timeout and a row cap. `truncated` tells whether rows were cut off.
+    """
     # Extract the SQL query from the request body
-    body = await request.json()
-    sql_query = body.get("query")
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="The request body must be JSON")
+    sql_query = body.get("query") if isinstance(body, dict) else None
+    if not isinstance(sql_query, str) or not sql_query.strip():
+        raise HTTPException(status_code=400, detail="A 'query' string is required")
 
     if "DELETE" in sql_query or "DROP" in sql_query or "INSERT" in sql_query:
         raise HTTPException(status_code=400, detail="Query type not allowed")
+    statement = check_statement(sql_query)
+    # Run as sent: collapsing whitespace would let a -- comment swallow the rest of the
+    # query and would change string literals
+    query_text = sql_query.strip().rstrip(';').rstrip()
 
-    # Execute the query in Snowflake
-    with snowflake_ctx.cursor() as cur:
-        cur.execute(sql_query)
-        rows = cur.fetchall()
+    format = negotiate_format(request, format)
+    fetch = fetch_arrow if format in ('arrow', 'parquet') else fetch_results
+    client_id = request.headers.get('x-client-id', '')[:128] or (request.client.host if request.client else 'unknown')
+
+    row_cap = EXECUTE_MAX_ROWS
+    key = query_cache.make_key(apply_row_cap(statement, row_cap), [format in ('arrow', 'parquet')])
+    result = query_cache.get(key)
+    if result is None:
+        async with admission.slot(client_id):
+            cost = await run_query_to_completion(explain_cost, query_text, timeout=EXECUTE_TIMEOUT) if re.match(r'^(SELECT|WITH)\b', statement, re.IGNORECASE) else None
+            if cost is not None:
+                if cost["cartesian_join"]:
+                    admission.reject("cartesian_join", 422, "Query plan contains a cartesian join")
+                if cost["bytes"] > EXECUTE_MAX_BYTES:
+                    admission.reject("too_expensive", 422, f"Query would scan {cost['bytes']} bytes")
+                if cost["bytes"] > EXECUTE_DOWNGRADE_BYTES:
+                    row_cap = EXECUTE_DOWNGRADED_ROWS
+                    admission.metrics["downgraded"] += 1
+            limited = apply_row_cap(query_text, row_cap)
+            try:
+                # The timeout is passed to the cursor as well, so Snowflake cancels the statement itself
+                result = await run_query_to_completion(partial(fetch, timeout=EXECUTE_TIMEOUT), limited,
+                                                       timeout=EXECUTE_TIMEOUT)
+            except HTTPException as e:
+                if e.status_code == 504:
+                    admission.metrics["timed_out"] += 1
+                raise
+            except snowflake.connector.errors.ProgrammingError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        result = (result, row_cap)
+        query_cache.put(key, result)
+    result, row_cap = result
+
+    if format in ('arrow', 'parquet'):
+        truncated = result.num_rows > row_cap
+        if truncated:
+            admission.metrics["truncated"] += 1
+            result = result.slice(0, row_cap)
+        return await arrow_response(result, format, {"X-Truncated": str(truncated).lower(), "X-Row-Cap": str(row_cap)})
+
+    rows, columns = result
+    truncated = len(rows) > row_cap
+    if truncated:
+        admission.metrics["truncated"] += 1
+        rows = rows[:row_cap]
+    if not rows:
+        return {"results": [], "truncated": False, "row_cap": row_cap}
+    results = [dict(zip(columns, row)) for row in rows]
+    return {"results": results, "truncated": truncated, "row_cap": row_cap}
+
+# Full-text search over the extracted Title/Subtitle/Content rows
+
+# BM25 index written by the pipeline (Pipeline_Scripts/search_index.py); shared through a volume
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', 'search_index/search_index.json')
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '100'))
+SEARCH_SNIPPET_CHARS = int(os.getenv('SEARCH_SNIPPET_CHARS', '300'))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+class SearchIndexReader:
+    """In-memory copy of the search index, reloaded whenever the pipeline rewrites the file.
+
+    The query is tokenized with the settings stored in the index, so it always matches
+    how the rows were indexed.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.index = None
+        self.pattern = None
+        self.stopwords = frozenset()
+
+    def current(self):
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            raise HTTPException(status_code=503, detail="Search index has not been built yet")
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+                self.pattern = re.compile(index['tokenizer']['pattern'])
+                self.stopwords = frozenset(index['tokenizer']['stopwords'])
+                self.index, self.mtime = index, mtime
+            return self.index
+
+    def tokenize(self, text):
+        return [token for token in self.pattern.findall(text.lower()) if token not in self.stopwords]
+
+    def search(self, text, limit):
+        index = self.current()
+        rows = index['rows']
         if not rows:
-            return {"results": []}  
-        columns = [desc[0] for desc in cur.description]
-        results = [dict(zip(columns, row)) for row in rows]
-        return {"results": results}
\ No newline at end of file
+            return []
+        avg_length = index['total_length'] / len(rows)
+        scores = {}
+        for term in set(self.tokenize(text)):
+            postings = index['postings'].get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(rows) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row_id, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * rows[row_id]['length'] / avg_length)
+                scores[row_id] = scores.get(row_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(rows[row_id], score) for row_id, score in ranked]
+
+    def snippet(self, content, text):
+        """The part of the content around the first query term it contains."""
+        lowered = content.lower()
+        positions = [lowered.find(term) for term in self.tokenize(text)]
+        start = min([position for position in positions if position >= 0], default=0)
+        start = max(0, start - SEARCH_SNIPPET_CHARS // 4)
+        snippet = content[start:start + SEARCH_SNIPPET_CHARS]
+        return ('...' if start else '') + snippet + ('...' if start + SEARCH_SNIPPET_CHARS < len(content) else '')
+
+search_index = SearchIndexReader(SEARCH_INDEX_PATH)
+
+# Plain def: FastAPI runs it on its thread pool, so reloading the index never blocks the event loop
+@app.get("/search")
+def search(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=SEARCH_MAX_RESULTS)):
+    """Rows ranked by BM25 for the query, answered from the local index without Snowflake or OpenAI."""
+    start = time.perf_counter()
+    results = [
+        {
+            "table": row['doc'],
+            "Title": row['Title'],
+            "Subtitle": row['Subtitle'],
+            "snippet": search_index.snippet(row['Content'], q),
+            "score": round(score, 4),
+        }
+        for row, score in search_index.search(q, limit)
+    ]
+    return {"query": q, "results": results, "took_ms": round((time.perf_counter() - start) * 1000, 2)}
@@ -0,0 +1,145 @@
+"""Session check for snowflake_transfer.bulk_load_tables against the sqlite stand-in connector.
+
+Usage (from the repository root, with the Airflow requirements installed):
+    python scripts/check_bulk_load.py [--tables 6] [--rows 500] [--workers 3] [--delay 0.05]
+
+Writes `tables` Parquet tables under a temporary parsed_into_schema and bulk loads them
+with `workers` tables in flight. The stand-in has no stages, so PUT keeps the staged
+file's rows and COPY INTO inserts them; everything else runs on sqlite. Checks that:
+  - every table's statements ran on one session, and no more than `workers` were opened
+  - every session was closed afterwards
+  - every table holds its rows, and a second run with unchanged files opens no session
+  - a table that fails to load makes the run raise TableLoadError once the others loaded
+"""
+import os
+import re
+import sys
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tables', type=int, default=6)
+    parser.add_argument('--rows', type=int, default=500, help='rows per table')
+    parser.add_argument('--workers', type=int, default=3, help='SNOWFLAKE_LOAD_WORKERS')
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds every stand-in statement takes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ.update({
+            'STAND_IN_DB': os.path.join(tmp_dir, 'stand_in.db'),
+            'STAND_IN_DELAY': str(args.delay),
+            'SNOWFLAKE_DDL_CACHE': os.path.join(tmp_dir, 'ddl_cache.json'),
+            'SNOWFLAKE_LOAD_MODE': 'merge',
+            'SNOWFLAKE_CHUNK_ROWS': str(max(1, args.rows // 3)),
+        })
+        sys.path.insert(0, os.path.join(ROOT, 'scripts', 'stand_in'))
+        sys.path.insert(1, os.path.join(ROOT, 'airflow', 'dags', 'Scripts', 'Pipeline_Scripts', 'SnowflakeTransfer'))
+        import pandas as pd
+        import snowflake.connector
+        import snowflake_transfer
+
+        schema_dir = os.path.join(tmp_dir, 'parsed_into_schema')
+        os.makedirs(os.path.join(schema_dir, 'content', 'parquet'))
+        for t in range(args.tables):
+            pd.DataFrame({
+                'Title': [f'Title {i % 7}' for i in range(args.rows)],
+                'Content': [f'Table {t} row {i}' for i in range(args.rows)],
+            }).to_parquet(os.path.join(schema_dir, 'content', 'parquet', f'table_{chr(97 + t)}.parquet'), index=False)
+        table_files = snowflake_transfer.discover_table_files(schema_dir)
+
+        lock = threading.Lock()
+        sessions = []
+        statements = []
+        staged = {}
+        in_flight = [0, 0]  # current, peak
+
+        class RecordingCursor(snowflake.connector.SnowflakeCursor):
+            def execute(self, sql, params=None, timeout=None):
+                with lock:
+                    statements.append((self.connection.session_id, sql))
+                    in_flight[0] += 1
+                    in_flight[1] = max(in_flight)
+                try:
+                    put = re.match(r"PUT 'file://(.+?)' @%(\w+)", sql)
+                    copy = re.match(r"COPY INTO (\w+)", sql)
+                    if put:
+                        with lock:
+                            staged.setdefault(put.group(2), []).append(pd.read_parquet(put.group(1)))
+                        return self
+                    if copy:
+                        for df in staged.pop(copy.group(1), []):
+                            df.to_sql(copy.group(1), self.connection._db, if_exists='append', index=False)
+                        return self
+                    if re.match(r"CREATE (WAREHOUSE|DATABASE|SCHEMA)", sql):
+                        return self
+                    return super().execute(sql, params, timeout)
+                finally:
+                    with lock:
+                        in_flight[0] -= 1
+
+        class RecordingConnection(snowflake.connector.SnowflakeConnection):
+            def __init__(self):
+                super().__init__()
+                with lock:
+                    self.session_id = len(sessions)
+                    sessions.append(self)
+
+            def cursor(self):
+                return RecordingCursor(self)
+
+        summaries = snowflake_transfer.bulk_load_tables(table_files, connect=RecordingConnection, workers=args.workers)
+
+        print('*************** Session Check ***************')
+        failures = []
+        for table_name in table_files:
+            used = {session_id for session_id, sql in statements if table_name.upper() in sql}
+            print(f"{table_name.upper()}: {sum(table_name.upper() in sql for _, sql in statements)} statements on sessions {sorted(used)}")
+            if len(used) != 1:
+                failures.append(f"{table_name} ran on {len(used)} sessions")
+        print(f"{len(sessions)} sessions opened for {args.workers} workers, "
+              f"{in_flight[1]} statements in flight at most")
+        if len(sessions) > args.workers:
+            failures.append(f"{len(sessions)} sessions opened")
+        if not all(conn.is_closed() for conn in sessions):
+            failures.append("sessions left open")
+
+        check = snowflake.connector.connect()
+        for summary in summaries:
+            count = check.cursor().execute(f"SELECT COUNT(*) FROM {summary['table']}").fetchone()[0]
+            if count != args.rows:
+                failures.append(f"{summary['table']} has {count} rows")
+        check.close()
+        if len(summaries) != args.tables:
+            failures.append(f"{len(summaries)} of {args.tables} tables loaded")
+
+        opened = len(sessions)
+        snowflake_transfer.bulk_load_tables(table_files, connect=RecordingConnection, workers=args.workers)
+        if len(sessions) != opened:
+            failures.append("the unchanged second run opened a session")
+
+        with open(os.path.join(schema_dir, 'content', 'parquet', 'table_z.parquet'), 'wb') as f:
+            f.write(b'not a parquet file')
+        pd.DataFrame({'Title': ['New title'], 'Content': ['New row']}).to_parquet(
+            os.path.join(schema_dir, 'content', 'parquet', 'table_a.parquet'), index=False)
+        table_files = snowflake_transfer.discover_table_files(schema_dir)
+        try:
+            snowflake_transfer.bulk_load_tables(table_files, connect=RecordingConnection, workers=args.workers)
+            failures.append("a failed table did not fail the run")
+        except snowflake_transfer.TableLoadError as e:
+            print(f"Failed run: {e}; loaded {[summary['table'] for summary in e.summaries]}")
+            if [summary['table'] for summary in e.summaries] != ['TABLE_A']:
+                failures.append("the table that changed alongside the failed one was not loaded")
+
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        print("All checks passed" if not failures else f"{len(failures)} checks failed")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Load test and paging checks for fastapi/restApi.py against the sqlite stand-in connector.
+
+Usage (from the repository root, with fastapi/requirements.txt installed):
+    python scripts/load_test_api.py [--delay 0.2] [--pool 4] [--requests 8] [--rows 2500]
+
+Builds a stand-in GROBID_CONTENT table, then:
+  - times `requests` page requests one after another and all at once; with the connection
+    pool they overlap, so the concurrent run takes about requests / pool query delays
+  - closes every idle pooled connection and checks the next request recycles them
+  - pages through the whole table by cursor, by a non-unique key= column, and a table
+    without ROW_HASH by offset, and checks projection, NDJSON streaming and identifier
+    validation
+"""
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import sqlite3
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_database(path, rows):
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE GROBID_CONTENT ("TITLE" TEXT, "CONTENT" TEXT, "ROW_HASH" TEXT)')
+    db.executemany(
+        'INSERT INTO GROBID_CONTENT VALUES (?, ?, ?)',
+        [(f'Title {i % 50}', f'Content of row {i}', hashlib.sha256(str(i).encode()).hexdigest()) for i in range(rows)],
+    )
+    # No ROW_HASH column: paged by OFFSET instead of by key
+    db.execute('CREATE TABLE PLAIN_CONTENT ("TITLE" TEXT, "CONTENT" TEXT)')
+    db.executemany('INSERT INTO PLAIN_CONTENT VALUES (?, ?)', [(f'Title {i}', f'Content of row {i}') for i in range(25)])
+    db.commit()
+    db.close()
+
+
+async def run(restApi, args):
+    import httpx
+
+    transport = httpx.ASGITransport(app=restApi.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://stand-in') as client:
+        def page(i):
+            # Distinct cursors, so the query cache does not answer them
+            return client.get('/snowflake/table/grobid_content', params={'limit': 10, 'after': f'{i:x}'})
+
+        start = time.perf_counter()
+        for i in range(args.requests):
+            assert (await page(i)).status_code == 200
+        serial = time.perf_counter() - start
+
+        # New cursors again; the column lookup stays cached, so each request is one query
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[page(args.requests + i) for i in range(args.requests)])
+        concurrent = time.perf_counter() - start
+        assert all(response.status_code == 200 for response in responses)
+        print(f"{args.requests} page requests, {args.delay * 1000:.0f} ms per query, pool of {args.pool}: "
+              f"{serial:.2f}s one after another, {concurrent:.2f}s concurrently")
+
+        for conn, _ in list(restApi.snowflake_pool.idle.queue):
+            conn.close()
+        response = await client.get('/snowflake/tables')
+        print(f"After closing idle connections: {response.status_code}, pool {restApi.snowflake_pool.stats()}")
+
+        async def page_through(table, limit, **extra):
+            rows, after = [], None
+            while True:
+                params = {'limit': limit, **extra, **({'after': after} if after else {})}
+                body = (await client.get(f'/snowflake/table/{table}', params=params)).json()
+                rows.append(len(body['rows']))
+                seen.update(tuple(row) for row in body['rows'])
+                after = body['next']
+                if after is None:
+                    return rows
+
+        seen = set()
+        pages = await page_through('grobid_content', 1000)
+        print(f"Paged {len(seen)} distinct rows of {args.rows} by key: {pages}")
+        seen = set()
+        # TITLE repeats every 50 rows: ROW_HASH breaks the ties, so page boundaries skip nothing
+        pages = await page_through('grobid_content', 120, key='TITLE')
+        print(f"Paged {len(seen)} distinct rows of {args.rows} by non-unique key=TITLE in {len(pages)} pages")
+        response = await client.get('/snowflake/table/grobid_content', params={'key': 'TITLE', 'after': 'Title 3'})
+        print(f"key= cursor that is not a [key, ROW_HASH] pair: {response.status_code}")
+        seen = set()
+        pages = await page_through('plain_content', 10)
+        print(f"Paged {len(seen)} distinct rows of 25 by offset: {pages}")
+        response = await client.get('/snowflake/table/plain_content', params={'after': 'not-a-number'})
+        print(f"Invalid offset cursor: {response.status_code}")
+
+        body = (await client.get('/snowflake/table/grobid_content', params={'limit': 5, 'columns': 'TITLE'})).json()
+        print(f"Projection columns: {body['columns']}")
+        response = await client.get('/snowflake/table/grobid_content', params={'format': 'ndjson'})
+        print(f"NDJSON stream: {len(response.text.splitlines())} lines")
+        response = await client.get('/snowflake/table/grobid_content', params={'columns': 'TITLE;DROP'})
+        print(f"Invalid identifier: {response.status_code}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds every stand-in query takes')
+    parser.add_argument('--pool', type=int, default=4, help='SNOWFLAKE_POOL_SIZE')
+    parser.add_argument('--requests', type=int, default=8, help='page requests per timing run')
+    parser.add_argument('--rows', type=int, default=2500, help='rows in the stand-in table')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['STAND_IN_DB'] = os.path.join(tmp_dir, 'stand_in.db')
+        os.environ['STAND_IN_DELAY'] = str(args.delay)
+        os.environ['SNOWFLAKE_POOL_SIZE'] = str(args.pool)
+        build_database(os.environ['STAND_IN_DB'], args.rows)
+
+        sys.path.insert(0, os.path.join(ROOT, 'scripts', 'stand_in'))
+        sys.path.insert(1, os.path.join(ROOT, 'fastapi'))
+        import restApi
+
+        asyncio.run(run(restApi, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""sqlite-backed stand-in for snowflake.connector, for load tests and checks without a Snowflake account.
+
+Put scripts/stand_in first on sys.path and `import snowflake.connector` gets this module.
+Every connection opens the sqlite file at STAND_IN_DB, and every execute sleeps
+STAND_IN_DELAY seconds first to mimic warehouse latency (the sleep releases the GIL, like
+a real network round-trip). Only what restApi.py and snowflake_transfer.py use is
+implemented; %s parameters are translated to sqlite's ?.
+"""
+import os
+import time
+import sqlite3
+from . import errors
+
+STAND_IN_DB = os.getenv('STAND_IN_DB', 'stand_in.db')
+STAND_IN_DELAY = float(os.getenv('STAND_IN_DELAY', '0'))
+
+
+class SnowflakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+        self.description = None
+        self.rowcount = -1
+        self.sfqid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def execute(self, sql, params=None, timeout=None):
+        if self.connection.is_closed():
+            raise errors.DatabaseError('Connection is closed')
+        time.sleep(STAND_IN_DELAY)
+        sql = sql.strip().rstrip(';')
+        if sql.upper().startswith('SHOW TABLES'):
+            # Same column layout as Snowflake's SHOW TABLES: the name is the second column
+            sql = "SELECT 'stand_in', name FROM sqlite_master WHERE type = 'table'"
+        try:
+            self._cursor.execute(sql.replace('%s', '?'), params or [])
+        except sqlite3.Error as e:
+            raise errors.ProgrammingError(str(e))
+        self.description = self._cursor.description
+        self.rowcount = self._cursor.rowcount
+        self.sfqid = f'stand-in-{id(self)}'
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class SnowflakeConnection:
+    def __init__(self, **kwargs):
+        self._db = sqlite3.connect(STAND_IN_DB, check_same_thread=False)
+        self._closed = False
+
+    def cursor(self):
+        return SnowflakeCursor(self)
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        if not self._closed:
+            self._db.close()
+            self._closed = True
+
+
+def connect(**kwargs):
+    return SnowflakeConnection(**kwargs)
@@ -0,0 +1,18 @@
+class Error(Exception):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class NotSupportedError(DatabaseError):
+    pass
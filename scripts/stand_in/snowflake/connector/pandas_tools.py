@@ -0,0 +1,4 @@
+def write_pandas(conn, df, table_name, **kwargs):
+    """Append a DataFrame to a table of the stand-in connection."""
+    df.to_sql(table_name, conn._db, if_exists='append', index=False)
+    return True, 1, len(df), []
@@ -63,7 +63,12 @@ def main():
             # Trigger DAG via FastAPI
             response = requests.post(f"{FASTAPI_URL}/trigger-airflow-dag", json=payload)
             if response.status_code in [200, 201]:
-                st.success("Pipeline triggered successfully!")
+                run_id = response.json()["details"].get("dag_run_id")
+                if response.json().get("coalesced"):
+                    # A run was already queued or running; this click was attached to it
+                    st.info(f"Pipeline is already running (run {run_id}).")
+                else:
+                    st.success(f"Pipeline triggered successfully! (run {run_id})")
             else:
                 st.error(f"Error triggering pipeline: {response.text}")
 
@@ -2,8 +2,10 @@ import streamlit as st
 import requests
 from dotenv import load_dotenv
 import os
+import uuid
 import openai
 import pandas as pd
+import pyarrow as pa
 
 # Load environment variables
 load_dotenv()
@@ -24,25 +26,52 @@ def get_table_names():
         st.error("Failed to fetch table names.")
         return []
 
+# Ask the API for Arrow IPC instead of JSON: the result is read straight into pandas
+ARROW_HEADERS = {"Accept": "application/vnd.apache.arrow.stream"}
+
+# Every browser session is its own client for the API's per-client query slots
+def client_headers():
+    if "client_id" not in st.session_state:
+        st.session_state.client_id = uuid.uuid4().hex
+    return {**ARROW_HEADERS, "X-Client-Id": st.session_state.client_id}
+
+def read_arrow(response):
+    return pa.ipc.open_stream(response.content).read_pandas()
+
 # Function to display table data via FastAPI
 def display_table_data(table_name):
-    response = requests.get(f"{FASTAPI_SERVICE_URL}/snowflake/table/{table_name}")
+    response = requests.get(f"{FASTAPI_SERVICE_URL}/snowflake/table/{table_name}", headers=ARROW_HEADERS)
     #st.error(table_name)
     if response.status_code in [200, 201]:
         try:
-            data = response.json()
-            df = pd.DataFrame(data['rows'], columns=data['columns'])
+            df = read_arrow(response)
             
-            st.write(f"All rows of {table_name}:")
+            # The API returns one page; X-Next-Cursor is set when the table has more rows
+            if response.headers.get('X-Next-Cursor'):
+                st.write(f"First {len(df)} rows of {table_name}:")
+            else:
+                st.write(f"All rows of {table_name}:")
             # Use st.dataframe to display the data with a scrolling window
             st.dataframe(df)
-        except ValueError: 
-            st.error("Failed to decode the response as JSON.")
+        except pa.ArrowInvalid:
+            st.error("Failed to decode the response as Arrow.")
     elif response.status_code == 500:
         st.error("Server error occurred.")
     else:
         st.error(f"Failed to fetch table data for {table_name}. Status code: {response.status_code}")
 
+# Function to search the extracted content via FastAPI (local index, no OpenAI or Snowflake call)
+def search_content(query):
+    response = requests.get(f"{FASTAPI_SERVICE_URL}/search", params={"q": query, "limit": 20})
+    if response.status_code == 200:
+        results = response.json()["results"]
+        if results:
+            st.dataframe(pd.DataFrame(results))
+        else:
+            st.write("No matching content.")
+    else:
+        st.error(f"Search failed. Status code: {response.status_code}")
+
 # Function to generate SQL query using OpenAI's API
 def generate_sql_query(prompt, selected_table):
     response = openai.ChatCompletion.create(
@@ -72,6 +101,10 @@ def main():
     if selected_table:
         display_table_data(selected_table)
 
+    search_query = st.text_input("Search content:")
+    if search_query:
+        search_content(search_query)
+
     prompt = st.text_area("Enter your prompt:", height=100)
     
     if st.button("Generate SQL"):
@@ -87,11 +120,13 @@ def main():
         if "generated_sql_query" in st.session_state:
             sql_query = st.session_state.generated_sql_query
             # Send the SQL query to the FastAPI endpoint for execution
-            response = requests.post(f"{FASTAPI_SERVICE_URL}/snowflake/execute", json={"query": sql_query})
+            response = requests.post(f"{FASTAPI_SERVICE_URL}/snowflake/execute", json={"query": sql_query},
+                                     headers=client_headers())
             if response.status_code in [200, 201]:
-                data = response.json()
                 st.write(f"Query Results:")
-                df = pd.DataFrame(data["results"])
+                df = read_arrow(response)
+                if response.headers.get('X-Truncated') == 'true':
+                    st.warning(f"Showing the first {response.headers.get('X-Row-Cap')} rows; the query returned more.")
                 st.dataframe(df)
             else:
                 st.error("Failed to execute the query. Error: {}".format(response.text))